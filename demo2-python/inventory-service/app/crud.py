@@ -2,8 +2,10 @@ import logging
 import time
 from .models import Product
 from bson import ObjectId
+from pymongo import ReturnDocument
 from fastapi import HTTPException
 from .database import products_collection  # Import the PyMongo collection
+from .instrumentation import handler_logger, set_span_attributes
 from opentelemetry import trace
 from opentelemetry.trace import Tracer
 from opentelemetry.metrics import (
@@ -60,6 +62,15 @@ def avaiability_helper(product, requested_quantity) -> dict:
         "available": product["quantity"] >= requested_quantity
     }
 
+# Update pipeline that subtracts `quantity` only when enough stock is left,
+# so the check and the decrement happen in one atomic server-side operation
+def conditional_decrement(quantity: int) -> list:
+    return [{"$set": {"quantity": {"$cond": [
+        {"$gte": ["$quantity", quantity]},
+        {"$subtract": ["$quantity", quantity]},
+        "$quantity",
+    ]}}}]
+
 
 # ==========================
 # API HANDLERS
@@ -67,12 +78,13 @@ def avaiability_helper(product, requested_quantity) -> dict:
 
 # Get a single product by ID
 def get_product(product_id: str) -> dict:
+    log = handler_logger(logger, "get_product")
     with tracer.start_as_current_span("get_product") as span:
         request_counter.add(1)  # Increment counter on request
         query = {"_id": ObjectId(product_id)}
-        span.set_attribute("db.query", str(query))
+        set_span_attributes(span, lambda: {"db.query": str(query)})
         start_time = time.time()
-        logger.info(f"Querying product with ID: {product_id}")
+        log.info("Querying product with ID: %s", product_id)
         
         # Start tracing the database query
         product = products_collection.find_one(query)
@@ -80,23 +92,23 @@ def get_product(product_id: str) -> dict:
         
         # Add query execution time to the span attribute
         span.set_attribute("db.query_duration", elapsed_time)
-        logger.info(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
+        log.info("Query executed in %.4f seconds with query: %s", elapsed_time, query)
         
         if product is None:
             #search_counter.add(1)
-            logger.error(f"Product {product_id} not found")
+            log.error("Product %s not found", product_id)
             raise HTTPException(status_code=404, detail="Product not found")
         
         search_counter.add(1, {"product_name": product["name"]})
-        logger.info(f"increment search of {product["name"]}")
+        log.info("increment search of %s", product["name"])
         return product_helper(product)
 
 def check_availability(product_name: str, quantity: int) -> dict:
+    log = handler_logger(logger, "check_availability")
     with tracer.start_as_current_span("check_availability") as span:
         request_counter.add(1)  # Increment counter on request
-        span.set_attribute("db.query.product_name", product_name)
-        span.set_attribute("db.query.quantity", quantity)
-        logger.info(f"Check avaiability product with name: {product_name}")
+        set_span_attributes(span, lambda: {"db.query.product_name": product_name, "db.query.quantity": quantity})
+        log.info("Check avaiability product with name: %s", product_name)
         
         query = {"name": product_name}
         product = products_collection.find_one(query)
@@ -107,46 +119,45 @@ def check_availability(product_name: str, quantity: int) -> dict:
             raise HTTPException(status_code=404, detail="Product not found")
 
 def reduce_quantity(product_name: str, quantity: int) -> dict:
+    log = handler_logger(logger, "reduce_quantity")
     with tracer.start_as_current_span("reduce_quantity") as span:
         request_counter.add(1)  # Increment counter on request
-        span.set_attribute("db.query.product_name", product_name)
-        span.set_attribute("db.query.quantity", quantity)
+        set_span_attributes(span, lambda: {"db.query.product_name": product_name, "db.query.quantity": quantity})
         # Ensure quantity to reduce is a positive integer
         if quantity <= 0:
             raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
 
-        # Find the product by name
-        product = products_collection.find_one({"name": product_name})
-        logger.info(f"product found {product}")
+        # Check and reduce the stock in a single round trip. The pre-update document
+        # tells "not found" (None) apart from "not enough stock" (quantity unchanged)
+        product = products_collection.find_one_and_update(
+            {"name": product_name},  # Find the product by name
+            conditional_decrement(quantity),  # Reduce only if enough stock is left
+            return_document=ReturnDocument.BEFORE
+        )
 
         if product is None:
             raise HTTPException(status_code=404, detail="Product not found")
 
         #search_counter.add(1)
 
-        # Ensure the product has enough quantity to reduce
         if product["quantity"] < quantity:
             raise HTTPException(status_code=400, detail="Not enough stock to reduce")
 
-        # Reduce the quantity by the given amount
-        updated_product = products_collection.find_one_and_update(
-            {"name": product_name},  # Find the product by name
-            {"$inc": {"quantity": -quantity}},  # Reduce the quantity by the specified amount
-            return_document=True  # Return the updated document
-        )
-        logger.info(f"product update {updated_product}")
+        product["quantity"] -= quantity
+        log.info("product update %s", product)
 
-        return product_helper(updated_product)
+        return product_helper(product)
 
 
 # Get a list of all products
 def get_products(skip: int = 0, limit: int = 100) -> list:
+    log = handler_logger(logger, "get_products")
     with tracer.start_as_current_span("get_products") as span:
         request_counter.add(1)  # Increment counter on request
         query = {}
-        span.set_attribute("db.query", str(query))
+        set_span_attributes(span, lambda: {"db.query": str(query)})
         start_time = time.time()
-        logger.info(f"Querying all products with skip={skip} and limit={limit}")
+        log.info("Querying all products with skip=%s and limit=%s", skip, limit)
         
         # Start tracing the database query
         products = products_collection.find(query).skip(skip).limit(limit)
@@ -154,12 +165,13 @@ def get_products(skip: int = 0, limit: int = 100) -> list:
         
         # Add query execution time to the span attribute
         span.set_attribute("db.query_duration", elapsed_time)
-        logger.info(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
+        log.info("Query executed in %.4f seconds with query: %s", elapsed_time, query)
         
         return [product_helper(product) for product in products]
 
 # Create a new product
 def create_product(product: Product) -> dict:
+    log = handler_logger(logger, "create_product")
     with tracer.start_as_current_span("create_product") as span:
         request_counter.add(1)  # Increment counter on request
         product_dict = product.dict()
@@ -171,7 +183,7 @@ def create_product(product: Product) -> dict:
         elapsed_time = time.time() - start_time
         span.set_attribute("db.query_duration", elapsed_time)
         
-        logger.info(f"Inserted new product with ID: {result.inserted_id} in {elapsed_time:.4f} seconds")
+        log.info("Inserted new product with ID: %s in %.4f seconds", result.inserted_id, elapsed_time)
         
         # Retrieve the newly inserted product
         new_product = products_collection.find_one({"_id": result.inserted_id})
@@ -179,20 +191,21 @@ def create_product(product: Product) -> dict:
 
 # Update an existing product
 def update_product(product_id: str, product: Product) -> dict:
+    log = handler_logger(logger, "update_product")
     with tracer.start_as_current_span("update_product") as span:
         request_counter.add(1)  # Increment counter on request
         product_dict = product.dict(exclude_unset=True)
         query = {"_id": ObjectId(product_id)}
-        span.set_attribute("db.query", str(query))
+        set_span_attributes(span, lambda: {"db.query": str(query)})
         start_time = time.time()
-        logger.info(f"Updating product with ID: {product_id}")
+        log.info("Updating product with ID: %s", product_id)
         
         # Start tracing the update query
         result = products_collection.update_one(query, {"$set": product_dict})
         elapsed_time = time.time() - start_time
         span.set_attribute("db.query_duration", elapsed_time)
         
-        logger.info(f"Update query executed in {elapsed_time:.4f} seconds with query: {query}")
+        log.info("Update query executed in %.4f seconds with query: %s", elapsed_time, query)
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -202,19 +215,20 @@ def update_product(product_id: str, product: Product) -> dict:
 
 # Delete a product
 def delete_product(product_id: str) -> dict:
+    log = handler_logger(logger, "delete_product")
     with tracer.start_as_current_span("delete_product") as span:
         request_counter.add(1)  # Increment counter on request
         query = {"_id": ObjectId(product_id)}
-        span.set_attribute("db.query", str(query))
+        set_span_attributes(span, lambda: {"db.query": str(query)})
         start_time = time.time()
-        logger.info(f"Deleting product with ID: {product_id}")
+        log.info("Deleting product with ID: %s", product_id)
         
         # Start tracing the delete query
         result = products_collection.delete_one(query)
         elapsed_time = time.time() - start_time
         span.set_attribute("db.query_duration", elapsed_time)
         
-        logger.info(f"Delete query executed in {elapsed_time:.4f} seconds with query: {query}")
+        log.info("Delete query executed in %.4f seconds with query: %s", elapsed_time, query)
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -223,20 +237,21 @@ def delete_product(product_id: str) -> dict:
 
 # Get the quantity of a product by ID
 def get_product_quantity(product_id: str) -> dict:
+    log = handler_logger(logger, "get_product_quantity")
     with tracer.start_as_current_span("get_product_quantity") as span:
         request_counter.add(1)  # Increment counter on request
         query = {"_id": ObjectId(product_id)}
         projection = {"quantity": 1}
-        span.set_attribute("db.query", str(query))
+        set_span_attributes(span, lambda: {"db.query": str(query)})
         start_time = time.time()
-        logger.info(f"Querying quantity of product with ID: {product_id}")
+        log.info("Querying quantity of product with ID: %s", product_id)
         
         # Start tracing the query
         product = products_collection.find_one(query, projection)
         elapsed_time = time.time() - start_time
         span.set_attribute("db.query_duration", elapsed_time)
         
-        logger.info(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
+        log.info("Query executed in %.4f seconds with query: %s", elapsed_time, query)
         
         if product is None:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -4,23 +4,25 @@ from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
 from opentelemetry import trace
 from opentelemetry.trace import SpanKind
 from dotenv import load_dotenv
-from opentelemetry.context import attach
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
 
 # Load environment variables
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/inventorydb")
 
-# Initialize tracer
-trace.set_tracer_provider(TracerProvider())
+# Tracer comes from the provider installed by otel_bootstrap
 tracer = trace.get_tracer(__name__)
 
 # Enable OpenTelemetry instrumentation for PyMongo BEFORE opening the connection
 #PymongoInstrumentor().instrument()
 
-# Initialize PyMongo
+# Initialize PyMongo (connections are opened lazily, on first use)
 client = MongoClient(MONGO_URI)
 db = client["inventorydb"]
 products_collection = db["products"]
+
+
+def warm_up():
+    """Open the first pooled connection and touch the products collection before serving traffic."""
+    client.admin.command("ping")
+    products_collection.find_one({}, {"_id": 1})
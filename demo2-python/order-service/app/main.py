@@ -1,100 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine
+from .database import SessionLocal, engine, warm_up
 from .models import Base
 from .crud import create_order, get_orders
 import logging
 import os
 import time
 
-# OpenTelemetry Tracing Imports
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.resources import Resource
-
-# OpenTelemetry Logging Imports
-from opentelemetry._logs import set_logger_provider
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
-from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
+from otel_bootstrap import init_telemetry, shutdown_telemetry  # Shared OpenTelemetry setup
+from .telemetry import instrument_database
 
 logger = logging.getLogger(__name__)
 
-# ===========================
-# Initialize OpenTelemetry Tracing
-# ===========================
-
-service_name = "order-service"
-
-def init_otel_tracing(app):
-
-    # Set the tracer provider with a service name
-    trace.set_tracer_provider(
-        TracerProvider(resource=Resource.create({"service.name": service_name}))
-    )
-    tracer_provider = trace.get_tracer_provider()
-
-    # Set up OTLP exporter
-    otlp_exporter = OTLPSpanExporter(
-        endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
-    )
-
-    # Set up BatchSpanProcessor
-    span_processor = BatchSpanProcessor(otlp_exporter)
-    tracer_provider.add_span_processor(span_processor)
-
-    # Instrument FastAPI
-    FastAPIInstrumentor.instrument_app(app)
-
-
-# ===========================
-# Initialize OpenTelemetry Logging
-# ===========================
-
-def init_otel_logging():
-    """Set up OpenTelemetry Logging to export logs via OTLP."""
-
-    # Define service name in logs
-    logger_provider = LoggerProvider(
-        resource=Resource.create({
-            "service.name": service_name,
-        })
-    )
-
-    # Set global LoggerProvider
-    set_logger_provider(logger_provider)
-
-    # Configure OTLP Log Exporter
-    exporter = OTLPLogExporter(insecure=True)
-
-    # Add Batch Log Processor
-    logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
-
-    # Create Logging Handler and Attach to Root Logger
-    handler = LoggingHandler(level=logging.NOTSET, logger_provider=logger_provider)
-    logging.getLogger().addHandler(handler)
-
-    print("Logging initialized with OTLP Exporter")
-
-
 # ===========================
 # Initialize FastAPI Application
 # ===========================
 
-app = FastAPI()
+def init_db():
+    Base.metadata.create_all(bind=engine)
+    warm_up()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables and warm up the connection pool off the event loop
+    await asyncio.to_thread(init_db)
+    logger.info("Order service ready")
+    yield
+    # Runs on SIGTERM: release connections and flush telemetry within its deadline
+    engine.dispose()
+    await asyncio.to_thread(shutdown_telemetry)
 
-# Initialize OpenTelemetry Tracing and Logging
-init_otel_tracing(app)
-init_otel_logging()
+app = FastAPI(lifespan=lifespan)
 
-# Initialize DB
-Base.metadata.create_all(bind=engine)
+# Initialize OpenTelemetry tracing, metrics and logging (once per process)
+telemetry = init_telemetry(app, "order-service")
 
-# Setup tracing
-#telemetry.setup_tracing(app)
+# Trace SQL statements on the order engine
+instrument_database(telemetry)
 
 # Dependency for DB session
 def get_db():
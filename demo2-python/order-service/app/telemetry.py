@@ -1,7 +1,19 @@
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+import os
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
-from database import engine
+from .database import engine
 
-def setup_tracing(app):
-    FastAPIInstrumentor.instrument_app(app)
-    SQLAlchemyInstrumentor().instrument(engine=engine)
+# Same switch as opentelemetry-instrument: a comma-separated list such as "sqlalchemy"
+DISABLED_INSTRUMENTATIONS = {
+    name.strip() for name in os.getenv("OTEL_PYTHON_DISABLED_INSTRUMENTATIONS", "").split(",") if name.strip()
+}
+
+
+def instrument_database(telemetry):
+    """Trace every statement run on the order engine unless "sqlalchemy" is disabled."""
+    if "sqlalchemy" in DISABLED_INSTRUMENTATIONS:
+        return
+    SQLAlchemyInstrumentor().instrument(
+        engine=engine,
+        tracer_provider=telemetry.tracer_provider,
+        meter_provider=telemetry.meter_provider,
+    )
@@ -0,0 +1,60 @@
+import os
+
+# ===========================
+# Exporter configuration
+# ===========================
+
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+OTLP_INSECURE = os.getenv("OTEL_EXPORTER_OTLP_INSECURE", "true").lower() == "true"
+
+# ===========================
+# Sampling configuration
+# ===========================
+
+# always_on | always_off | traceidratio | ratelimiting, optionally prefixed with "parentbased_"
+# so that child spans follow the decision of their parent
+TRACES_SAMPLER = os.getenv("OTEL_TRACES_SAMPLER", "parentbased_always_on")
+# Ratio for traceidratio, traces per second for ratelimiting
+TRACES_SAMPLER_ARG = os.getenv("OTEL_TRACES_SAMPLER_ARG")
+
+# ===========================
+# BatchSpanProcessor tuning (same names and defaults as the SDK)
+# ===========================
+
+BSP_MAX_QUEUE_SIZE = int(os.getenv("OTEL_BSP_MAX_QUEUE_SIZE", "2048"))
+BSP_MAX_EXPORT_BATCH_SIZE = int(os.getenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "512"))
+BSP_SCHEDULE_DELAY = int(os.getenv("OTEL_BSP_SCHEDULE_DELAY", "5000"))  # milliseconds
+BSP_EXPORT_TIMEOUT = int(os.getenv("OTEL_BSP_EXPORT_TIMEOUT", "30000"))  # milliseconds
+
+# ===========================
+# Metrics
+# ===========================
+
+METRIC_EXPORT_INTERVAL = int(os.getenv("OTEL_METRIC_EXPORT_INTERVAL", "60000"))  # milliseconds
+
+# ===========================
+# Logs
+# ===========================
+
+# "queue" hands records to a background thread for OTLP export, "direct" exports from the caller
+LOGS_PIPELINE = os.getenv("OTEL_LOGS_PIPELINE", "queue")
+# Minimum level exported through OTLP (stderr logging is configured separately)
+LOGS_MIN_LEVEL = os.getenv("OTEL_LOGS_MIN_LEVEL", "INFO").upper()
+# Records buffered for the background thread; new records are dropped when full
+LOGS_QUEUE_SIZE = int(os.getenv("OTEL_LOGS_QUEUE_SIZE", "10000"))
+# Records per second per logger sent to OTLP (0 disables the limit); LOGS_RATE_LIMITS
+# overrides it per logger name, e.g. "app.crud=50,uvicorn.access=10"
+LOGS_RATE_LIMIT = float(os.getenv("OTEL_LOGS_RATE_LIMIT", "0"))
+LOGS_RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=", 1) for item in os.getenv("OTEL_LOGS_RATE_LIMITS", "").split(",") if "=" in item
+    )
+}
+
+# ===========================
+# Shutdown
+# ===========================
+
+# Overall deadline for flushing every signal when the service stops
+SHUTDOWN_TIMEOUT = int(os.getenv("OTEL_SHUTDOWN_TIMEOUT", "5000"))  # milliseconds
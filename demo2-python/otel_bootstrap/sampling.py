@@ -0,0 +1,55 @@
+import time
+import threading
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF,
+    ALWAYS_ON,
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from .config import TRACES_SAMPLER, TRACES_SAMPLER_ARG
+
+
+class RateLimitingSampler(Sampler):
+    """Samples at most `traces_per_second` new traces per second (token bucket)."""
+
+    def __init__(self, traces_per_second: float):
+        self._rate = traces_per_second
+        self._capacity = max(traces_per_second, 1.0)
+        self._balance = self._capacity
+        self._last_tick = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        with self._lock:
+            now = time.monotonic()
+            self._balance = min(self._capacity, self._balance + (now - self._last_tick) * self._rate)
+            self._last_tick = now
+            sampled = self._balance >= 1.0
+            if sampled:
+                self._balance -= 1.0
+        if not sampled:
+            return SamplingResult(Decision.DROP, None, trace_state)
+        return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, trace_state)
+
+    def get_description(self) -> str:
+        return f"RateLimitingSampler{{{self._rate}}}"
+
+
+def build_sampler() -> Sampler:
+    """Build the sampler selected by OTEL_TRACES_SAMPLER / OTEL_TRACES_SAMPLER_ARG."""
+    parent_based = TRACES_SAMPLER.startswith("parentbased_")
+    name = TRACES_SAMPLER.removeprefix("parentbased_")
+
+    if name == "traceidratio":
+        root = TraceIdRatioBased(float(TRACES_SAMPLER_ARG or "1.0"))
+    elif name == "ratelimiting":
+        root = RateLimitingSampler(float(TRACES_SAMPLER_ARG or "100"))
+    elif name == "always_off":
+        root = ALWAYS_OFF
+    else:
+        root = ALWAYS_ON
+
+    return ParentBased(root) if parent_based else root
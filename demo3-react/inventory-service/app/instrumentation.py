@@ -0,0 +1,48 @@
+import os
+import random
+import logging
+from functools import lru_cache
+from typing import Callable
+
+# ==========================
+# Log sampling configuration
+# ==========================
+
+# Fraction of DEBUG/INFO records kept per handler; WARNING and above are never sampled.
+# LOG_SAMPLE_RATES overrides the default per handler, e.g. "get_products=0.01,get_product=0.1"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=", 1) for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if "=" in item
+    )
+}
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Logger adapter that drops a share of low-severity records before they are formatted."""
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+@lru_cache(maxsize=None)
+def handler_logger(logger: logging.Logger, handler: str) -> SampledLogger:
+    """Return the sampled logger for a crud handler (cached, so cheap to call per request)."""
+    return SampledLogger(logger, LOG_SAMPLE_RATES.get(handler, LOG_SAMPLE_RATE))
+
+
+# ==========================
+# Span attributes
+# ==========================
+
+def set_span_attributes(span, attributes: Callable[[], dict]) -> None:
+    """Build and set span attributes only when the span is sampled."""
+    if span.is_recording():
+        span.set_attributes(attributes())
@@ -1,111 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
 from . import crud, models
-from .tracing import init_tracing  # Import OpenTelemetry setup
 import time
 import logging
 import os
 from fastapi.middleware.cors import CORSMiddleware
 
-# OpenTelemetry Tracing Imports
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
-from opentelemetry.sdk.resources import Resource
-
-# OpenTelemetry Logging Imports
-from opentelemetry._logs import set_logger_provider
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
-from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
-
-# OpenTelemetry Metrics Import
-
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
-    OTLPMetricExporter,
-)
-from opentelemetry.metrics import (
-    CallbackOptions,
-    Observation,
-    get_meter_provider,
-    set_meter_provider,
-)
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-
-
-# ===========================
-# Initialize OpenTelemetry Tracing
-# ===========================
-def init_otel_tracing(app):
-    service_name = "inventory-service"
-
-    # Set the tracer provider with a service name
-    trace.set_tracer_provider(
-        TracerProvider(resource=Resource.create({"service.name": service_name}))
-    )
-    tracer_provider = trace.get_tracer_provider()
+from otel_bootstrap import init_telemetry, shutdown_telemetry  # Shared OpenTelemetry setup
+from .database import client as mongo_client, warm_up
 
-    # Set up OTLP exporter
-    otlp_exporter = OTLPSpanExporter(
-        endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
-    )
-
-    # Set up BatchSpanProcessor
-    span_processor = BatchSpanProcessor(otlp_exporter)
-    tracer_provider.add_span_processor(span_processor)
-
-    # Instrument FastAPI
-    FastAPIInstrumentor.instrument_app(app)
-
-
-# ===========================
-# Initialize OpenTelemetry Logging
-# ===========================
 logger = logging.getLogger(__name__)
 
-def init_otel_logging():
-    """Set up OpenTelemetry Logging to export logs via OTLP."""
-
-    # Define service name in logs
-    logger_provider = LoggerProvider(
-        resource=Resource.create({
-            "service.name": "inventory-service",
-        })
-    )
-
-    # Set global LoggerProvider
-    set_logger_provider(logger_provider)
-
-    # Configure OTLP Log Exporter
-    exporter = OTLPLogExporter(insecure=True)
-
-    # Add Batch Log Processor
-    logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
-
-    # Create Logging Handler and Attach to Root Logger
-    handler = LoggingHandler(level=logging.NOTSET, logger_provider=logger_provider)
-    logging.getLogger().addHandler(handler)
-
-    print("Logging initialized with OTLP Exporter")
-
-
-# ===========================
-# Initialize Metrics
-# ===========================
-
-exporter_metric = OTLPMetricExporter(endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317"), insecure=True)
-reader_metric = PeriodicExportingMetricReader(exporter_metric)
-provider_metric = MeterProvider(metric_readers=[reader_metric])
-set_meter_provider(provider_metric)
-
 # ===========================
 # Initialize FastAPI Application
 # ===========================
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up the Mongo pool off the event loop before accepting requests
+    await asyncio.to_thread(warm_up)
+    logger.info("Inventory service ready")
+    yield
+    # Runs on SIGTERM: release connections and flush telemetry within its deadline
+    mongo_client.close()
+    await asyncio.to_thread(shutdown_telemetry)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -116,9 +37,8 @@ app.add_middleware(
 )
 
 
-# Initialize OpenTelemetry Tracing and Logging
-init_otel_tracing(app)
-init_otel_logging()
+# Initialize OpenTelemetry tracing, metrics and logging (once per process)
+init_telemetry(app, "inventory-service")
 
 # Create a product
 @app.post("/products/", response_model=models.ProductInResponse)
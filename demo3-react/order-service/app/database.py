@@ -1,12 +1,89 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from opentelemetry.metrics import CallbackOptions, Observation, get_meter_provider
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# ===========================
+# Connection pool configuration
+# ===========================
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Extra connections opened under load, closed on return
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Test connections on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds before a connection is replaced (-1 = never)
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))  # Server-side limit per statement in ms (0 = none)
+
+meter = get_meter_provider().get_meter("custom-metrics", "1.0.0")
+
+pool_wait_histogram = meter.create_histogram(
+    name="db_client_connections_wait_time",
+    unit="ms",
+    description="Time spent waiting for a connection from the pool",
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_histogram.record((time.perf_counter() - start) * 1000)
+
+
+connect_args = {}
+if DB_STATEMENT_TIMEOUT > 0:
+    # libpq startup option, applied to every connection the pool opens
+    connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args=connect_args,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 metadata = MetaData()
+
+
+# ===========================
+# Pool gauges
+# ===========================
+
+def observe_checked_out(options: CallbackOptions):
+    yield Observation(engine.pool.checkedout())
+
+def observe_overflow(options: CallbackOptions):
+    # Negative while the pool has not opened all of its pool_size connections yet
+    yield Observation(max(engine.pool.overflow(), 0))
+
+meter.create_observable_gauge(
+    "db_client_connections_checked_out",
+    callbacks=[observe_checked_out],
+    description="Connections currently checked out of the pool",
+)
+meter.create_observable_gauge(
+    "db_client_connections_overflow",
+    callbacks=[observe_overflow],
+    description="Connections open beyond pool_size",
+)
+
+
+def warm_up():
+    """Open the first pooled connection before serving traffic."""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
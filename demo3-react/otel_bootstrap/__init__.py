@@ -0,0 +1,137 @@
+"""
+Shared OpenTelemetry bootstrap for the demo services.
+
+Every service calls `init_telemetry(app, service_name)` once at startup; it
+installs a single tracer, meter and logger provider that share one Resource
+and one exporter per signal, then instruments the FastAPI app.
+`shutdown_telemetry()` flushes and stops them when the service exits.
+"""
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from logging.handlers import QueueListener
+
+from opentelemetry import trace
+from opentelemetry._logs import set_logger_provider
+from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.metrics import set_meter_provider
+from opentelemetry.sdk._logs import LoggerProvider
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+
+from .config import METRIC_EXPORT_INTERVAL, OTLP_ENDPOINT, OTLP_INSECURE, SHUTDOWN_TIMEOUT
+from .export import CountingBatchSpanProcessor
+from .logs import attach_log_handler
+from .sampling import RateLimitingSampler, build_sampler
+
+__all__ = ["Telemetry", "init_telemetry", "shutdown_telemetry", "build_sampler", "RateLimitingSampler", "CountingBatchSpanProcessor"]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Telemetry:
+    resource: Resource
+    tracer_provider: TracerProvider
+    meter_provider: MeterProvider
+    logger_provider: LoggerProvider
+    log_listener: QueueListener | None = None
+
+
+_telemetry: Telemetry | None = None
+_lock = threading.Lock()
+
+
+def init_telemetry(app, service_name: str) -> Telemetry:
+    """Set up tracing, metrics and logging exactly once per process and instrument `app`."""
+    global _telemetry
+    with _lock:
+        if _telemetry is None:
+            _telemetry = _create_providers(service_name)
+        if not getattr(app.state, "otel_instrumented", False):
+            FastAPIInstrumentor.instrument_app(app, tracer_provider=_telemetry.tracer_provider)
+            app.state.otel_instrumented = True
+    return _telemetry
+
+
+def shutdown_telemetry(timeout_millis: int = SHUTDOWN_TIMEOUT) -> None:
+    """Flush every signal and shut the providers down, waiting at most `timeout_millis`."""
+    global _telemetry
+    with _lock:
+        telemetry, _telemetry = _telemetry, None
+    if telemetry is None:
+        return
+
+    # Exporter retries can outlive the timeout given to force_flush, so the work runs
+    # on a daemon thread and the caller only waits until the deadline
+    worker = threading.Thread(
+        target=_flush_and_shutdown, args=(telemetry, timeout_millis), name="otel-shutdown", daemon=True
+    )
+    worker.start()
+    worker.join(timeout_millis / 1000)
+    if worker.is_alive():
+        logger.warning("Telemetry flush did not finish within %s ms", timeout_millis)
+    else:
+        logger.info("Telemetry flushed and shut down")
+
+
+def _flush_and_shutdown(telemetry: Telemetry, timeout_millis: int) -> None:
+    deadline = time.monotonic() + timeout_millis / 1000
+
+    def remaining() -> int:
+        return max(0, int((deadline - time.monotonic()) * 1000))
+
+    # Stopping the listener hands the queued records to the logger provider first
+    if telemetry.log_listener is not None:
+        telemetry.log_listener.stop()
+
+    for provider in (telemetry.tracer_provider, telemetry.logger_provider, telemetry.meter_provider):
+        try:
+            provider.force_flush(remaining())
+        except Exception as e:
+            logger.warning("Failed to flush %s: %s", type(provider).__name__, e)
+
+    telemetry.tracer_provider.shutdown()
+    telemetry.logger_provider.shutdown()
+    try:
+        telemetry.meter_provider.shutdown(timeout_millis=remaining())
+    except Exception as e:
+        logger.warning("Failed to shut down MeterProvider: %s", e)
+
+
+def _create_providers(service_name: str) -> Telemetry:
+    # Resource.create also merges OTEL_RESOURCE_ATTRIBUTES from the environment
+    resource = Resource.create({"service.name": service_name})
+
+    # Traces
+    tracer_provider = TracerProvider(resource=resource, sampler=build_sampler())
+    tracer_provider.add_span_processor(
+        CountingBatchSpanProcessor(OTLPSpanExporter(endpoint=OTLP_ENDPOINT, insecure=OTLP_INSECURE))
+    )
+    trace.set_tracer_provider(tracer_provider)
+
+    # Metrics
+    reader = PeriodicExportingMetricReader(
+        OTLPMetricExporter(endpoint=OTLP_ENDPOINT, insecure=OTLP_INSECURE),
+        export_interval_millis=METRIC_EXPORT_INTERVAL,
+    )
+    meter_provider = MeterProvider(resource=resource, metric_readers=[reader])
+    set_meter_provider(meter_provider)
+
+    # Logs
+    logger_provider = LoggerProvider(resource=resource)
+    logger_provider.add_log_record_processor(
+        BatchLogRecordProcessor(OTLPLogExporter(endpoint=OTLP_ENDPOINT, insecure=OTLP_INSECURE))
+    )
+    set_logger_provider(logger_provider)
+    log_listener = attach_log_handler(logger_provider)
+
+    logger.info("Telemetry initialized for %s with OTLP exporter at %s", service_name, OTLP_ENDPOINT)
+    return Telemetry(resource, tracer_provider, meter_provider, logger_provider, log_listener)
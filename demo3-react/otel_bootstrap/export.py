@@ -0,0 +1,68 @@
+import threading
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.metrics import get_meter_provider
+from .config import (
+    BSP_EXPORT_TIMEOUT,
+    BSP_MAX_EXPORT_BATCH_SIZE,
+    BSP_MAX_QUEUE_SIZE,
+    BSP_SCHEDULE_DELAY,
+)
+
+meter = get_meter_provider().get_meter("custom-metrics", "1.0.0")
+
+dropped_span_counter = meter.create_counter(
+    "otel_dropped_spans",
+    description="Sampled spans that never reached the exporter or failed to export",
+)
+
+
+class _TrackedExporter(SpanExporter):
+    """Wraps the real exporter to report back how many queued spans left the processor."""
+
+    def __init__(self, exporter: SpanExporter, processor: "CountingBatchSpanProcessor"):
+        self._exporter = exporter
+        self._processor = processor
+
+    def export(self, spans):
+        result = self._exporter.export(spans)
+        self._processor._exported(len(spans), result is SpanExportResult.SUCCESS)
+        return result
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class CountingBatchSpanProcessor(BatchSpanProcessor):
+    """
+    BatchSpanProcessor configured from the OTEL_BSP_* settings that also counts
+    spans dropped because the queue was full or the export failed.
+    """
+
+    def __init__(self, exporter: SpanExporter):
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        super().__init__(
+            _TrackedExporter(exporter, self),
+            max_queue_size=BSP_MAX_QUEUE_SIZE,
+            schedule_delay_millis=BSP_SCHEDULE_DELAY,
+            max_export_batch_size=BSP_MAX_EXPORT_BATCH_SIZE,
+            export_timeout_millis=BSP_EXPORT_TIMEOUT,
+        )
+
+    def on_end(self, span) -> None:
+        if span.context.trace_flags.sampled:
+            with self._pending_lock:
+                if self._pending >= BSP_MAX_QUEUE_SIZE:
+                    dropped_span_counter.add(1, {"reason": "queue_full"})
+                else:
+                    self._pending += 1
+        super().on_end(span)
+
+    def _exported(self, count: int, success: bool) -> None:
+        with self._pending_lock:
+            self._pending = max(0, self._pending - count)
+        if not success:
+            dropped_span_counter.add(count, {"reason": "export_failed"})
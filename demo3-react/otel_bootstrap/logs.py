@@ -0,0 +1,118 @@
+import queue
+import time
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from opentelemetry import context
+from opentelemetry.metrics import CallbackOptions, Observation, get_meter_provider
+from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+from .config import (
+    LOGS_MIN_LEVEL,
+    LOGS_PIPELINE,
+    LOGS_QUEUE_SIZE,
+    LOGS_RATE_LIMIT,
+    LOGS_RATE_LIMITS,
+)
+
+meter = get_meter_provider().get_meter("custom-metrics", "1.0.0")
+
+dropped_log_counter = meter.create_counter(
+    "otel_dropped_log_records",
+    description="Log records not exported through OTLP because the queue was full or a rate limit applied",
+)
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger name; records over the limit are dropped and counted."""
+
+    def __init__(self, default_rate: float, rates: dict[str, float]):
+        super().__init__()
+        self._default_rate = default_rate
+        self._rates = rates
+        self._buckets: dict[str, list[float]] = {}  # logger name -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self._rates.get(record.name, self._default_rate)
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(record.name, [rate, now])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return True
+        dropped_log_counter.add(1, {"reason": "rate_limited", "logger": record.name})
+        return False
+
+
+# Record attribute carrying the caller's OTel context to the listener thread
+CONTEXT_ATTR = "otel_context"
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the OTLP handler on the listener thread, which
+        # needs the active span of the caller to stamp trace and span ids
+        setattr(record, CONTEXT_ATTR, context.get_current())
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_log_counter.add(1, {"reason": "queue_full"})
+
+
+class QueuedLoggingHandler(LoggingHandler):
+    """LoggingHandler for the listener thread: emits each record in the context saved by prepare()."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Popped so that the context is not exported as a log attribute
+        ctx = record.__dict__.pop(CONTEXT_ATTR, None)
+        if ctx is None:
+            super().emit(record)
+            return
+        token = context.attach(ctx)
+        try:
+            super().emit(record)
+        finally:
+            context.detach(token)
+
+
+def attach_log_handler(logger_provider: LoggerProvider) -> QueueListener | None:
+    """
+    Attach the OTLP logging handler to the root logger. In "queue" mode the
+    export runs on a background QueueListener thread, which is returned so it
+    can be stopped at shutdown.
+    """
+    if LOGS_PIPELINE != "queue":
+        otlp_handler = LoggingHandler(level=LOGS_MIN_LEVEL, logger_provider=logger_provider)
+        otlp_handler.addFilter(RateLimitFilter(LOGS_RATE_LIMIT, LOGS_RATE_LIMITS))
+        logging.getLogger().addHandler(otlp_handler)
+        return None
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOGS_QUEUE_SIZE)
+    # Level and rate limit are checked in the caller thread so dropped records never reach the queue
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.setLevel(LOGS_MIN_LEVEL)
+    queue_handler.addFilter(RateLimitFilter(LOGS_RATE_LIMIT, LOGS_RATE_LIMITS))
+    logging.getLogger().addHandler(queue_handler)
+
+    otlp_handler = QueuedLoggingHandler(level=LOGS_MIN_LEVEL, logger_provider=logger_provider)
+    listener = QueueListener(log_queue, otlp_handler, respect_handler_level=True)
+    listener.start()
+
+    def observe_queue_depth(options: CallbackOptions):
+        yield Observation(log_queue.qsize())
+
+    meter.create_observable_gauge(
+        "otel_log_queue_depth",
+        callbacks=[observe_queue_depth],
+        description="Log records waiting for the background OTLP export thread",
+    )
+    return listener
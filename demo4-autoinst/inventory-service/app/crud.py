@@ -2,6 +2,7 @@ import logging
 import time
 from .models import Product
 from bson import ObjectId
+from pymongo import ReturnDocument
 from fastapi import HTTPException
 from .database import products_collection  # Import the PyMongo collection
 
@@ -26,6 +27,15 @@ def avaiability_helper(product, requested_quantity) -> dict:
         "available": product["quantity"] >= requested_quantity
     }
 
+# Update pipeline that subtracts `quantity` only when enough stock is left,
+# so the check and the decrement happen in one atomic server-side operation
+def conditional_decrement(quantity: int) -> list:
+    return [{"$set": {"quantity": {"$cond": [
+        {"$gte": ["$quantity", quantity]},
+        {"$subtract": ["$quantity", quantity]},
+        "$quantity",
+    ]}}}]
+
 
 # ==========================
 # API HANDLERS
@@ -65,26 +75,24 @@ def reduce_quantity(product_name: str, quantity: int) -> dict:
     if quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
 
-    # Find the product by name
-    product = products_collection.find_one({"name": product_name})
-    logger.warn(f"Product found: {product}")
+    # Check and reduce the stock in a single round trip. The pre-update document
+    # tells "not found" (None) apart from "not enough stock" (quantity unchanged)
+    product = products_collection.find_one_and_update(
+        {"name": product_name},  # Find the product by name
+        conditional_decrement(quantity),  # Reduce only if enough stock is left
+        return_document=ReturnDocument.BEFORE
+    )
 
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Ensure the product has enough quantity to reduce
     if product["quantity"] < quantity:
         raise HTTPException(status_code=400, detail="Not enough stock to reduce")
 
-    # Reduce the quantity by the given amount
-    updated_product = products_collection.find_one_and_update(
-        {"name": product_name},  # Find the product by name
-        {"$inc": {"quantity": -quantity}},  # Reduce the quantity by the specified amount
-        return_document=True  # Return the updated document
-    )
-    logger.warn(f"Product updated: {updated_product}")
+    product["quantity"] -= quantity
+    logger.warn(f"Product updated: {product}")
 
-    return product_helper(updated_product)
+    return product_helper(product)
 
 # Get a list of all products
 def get_products(skip: int = 0, limit: int = 100) -> list:
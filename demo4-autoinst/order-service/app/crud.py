@@ -3,6 +3,9 @@ import os
 import requests
 from sqlalchemy.orm import Session
 from .models import Order
+from .pipeline import (
+    INVENTORY_CALL_TIMEOUT, INVOICE_CALL_TIMEOUT, ORDER_REQUEST_BUDGET, Budget, DeadlineExceeded, fan_out, run_stage
+)
 import random
 from datetime import datetime, timedelta
 import uuid
@@ -15,14 +18,12 @@ INVENTORY_SERVICE_URL = os.getenv("INVENTORY_SERVICE_URL", "http://inventory-ser
 INVOICE_SERVICE_URL = os.getenv("INVOICE_SERVICE_URL", "http://invoice-service:8003")
 
 
-def create_order(db: Session, item_name: str, quantity: int):
-    logger.info(f"Checking inventory for item: {item_name}, quantity: {quantity}")
-    
-    # Check inventory availability
+def check_availability(item_name: str, quantity: int, budget: Budget):
     try:
         response = requests.get(
             f"{INVENTORY_SERVICE_URL}/products/{item_name}/availability", 
-            params={"quantity": quantity}
+            params={"quantity": quantity},
+            timeout=budget.timeout(INVENTORY_CALL_TIMEOUT)
         )
         response.raise_for_status()
         inventory_data = response.json()
@@ -32,46 +33,88 @@ def create_order(db: Session, item_name: str, quantity: int):
     except requests.RequestException as e:
         logger.error(f"Failed to check inventory: {e}")
         return {"error": "Inventory check failed"}
-    
+    return None
+
+
+def store_order(db: Session, item_name: str, quantity: int):
     logger.info(f"Creating order: item_name={item_name}, quantity: {quantity}")
     order = Order(item_name=item_name, quantity=quantity)
     db.add(order)
     db.commit()
     db.refresh(order)
     logger.info(f"Order created: {order.id}")
-    
-    # Reduce inventory quantity
+    return order
+
+
+def reduce_inventory(item_name: str, quantity: int, budget: Budget):
     try:
         reduce_response = requests.post(
             f"{INVENTORY_SERVICE_URL}/products/{item_name}/reduce-quantity", 
-            json={"quantity": quantity}
+            json={"quantity": quantity},
+            timeout=budget.timeout(INVENTORY_CALL_TIMEOUT)
         )
         reduce_response.raise_for_status()
         logger.info(f"Inventory updated successfully for item: {item_name}, quantity reduced by {quantity}")
     except requests.RequestException as e:
         logger.error(f"Failed to reduce inventory: {e}")
         return {"error": "Inventory reduction failed"}
-    
-    # Generate invoice data
-    invoice_data = {
-        "CustomerName": f"Customer-{random.randint(1000, 9999)}",
-        "Amount": round(random.uniform(10.0, 500.0), 2),
-        "DueDate": (datetime.utcnow() + timedelta(days=random.randint(7, 30))).isoformat()
-    }
-    
-    # Send invoice creation request
+    return None
+
+
+def send_invoice(invoice_data: dict, budget: Budget):
     try:
         invoice_response = requests.post(
             f"{INVOICE_SERVICE_URL}/invoices", 
-            json=invoice_data
+            json=invoice_data,
+            timeout=budget.timeout(INVOICE_CALL_TIMEOUT)
         )
         invoice_response.raise_for_status()
         logger.info(f"Invoice created successfully: {invoice_data}")
     except requests.RequestException as e:
         logger.error(f"Failed to create invoice: {e}")
         return {"error": "Invoice creation failed"}
-    
-    return order
+    return None
+
+
+def create_order(db: Session, item_name: str, quantity: int):
+    budget = Budget()
+    logger.info(f"Checking inventory for item: {item_name}, quantity: {quantity}")
+
+    try:
+        # Stage 1: the availability check and the stock reduction gate the order,
+        # so nothing is stored unless the stock has been taken
+        error = run_stage("order.check_availability", check_availability, item_name, quantity, budget)
+        if error is not None:
+            return error
+        error = run_stage("order.reduce_inventory", reduce_inventory, item_name, quantity, budget)
+        if error is not None:
+            return error
+    except DeadlineExceeded:
+        logger.error(f"Order for item {item_name} exceeded its {ORDER_REQUEST_BUDGET}s budget")
+        return {"error": "Order deadline exceeded"}
+
+    # Generate invoice data
+    invoice_data = {
+        "CustomerName": f"Customer-{random.randint(1000, 9999)}",
+        "Amount": round(random.uniform(10.0, 500.0), 2),
+        "DueDate": (datetime.utcnow() + timedelta(days=random.randint(7, 30))).isoformat()
+    }
+
+    # Stage 2: the order is stored whatever is left of the budget, with the invoice
+    # sent alongside; once the order exists an invoice failure is only a warning
+    results = fan_out(budget, {
+        "order.store": lambda: store_order(db, item_name, quantity),
+        "order.send_invoice": lambda: send_invoice(invoice_data, budget),
+    }, late={"error": "Invoice not confirmed within the order deadline"})
+
+    order = results["order.store"]
+    if results["order.send_invoice"] is None:
+        return order
+    logger.warning(f"Order {order.id} stored without a confirmed invoice: {results['order.send_invoice']}")
+    return {
+        "id": order.id, "item_name": order.item_name, "quantity": order.quantity,
+        "warnings": [results["order.send_invoice"]["error"]],
+    }
 
 def get_orders(db: Session):
     logger.info("Fetching all orders")
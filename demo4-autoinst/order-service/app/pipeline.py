@@ -0,0 +1,66 @@
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from opentelemetry import trace
+
+# Overall time budget for one order and per-call deadlines for downstream services (seconds)
+ORDER_REQUEST_BUDGET = float(os.getenv("ORDER_REQUEST_BUDGET", "15"))
+INVENTORY_CALL_TIMEOUT = float(os.getenv("INVENTORY_CALL_TIMEOUT", "5"))
+INVOICE_CALL_TIMEOUT = float(os.getenv("INVOICE_CALL_TIMEOUT", "5"))
+# Threads shared by all requests for the concurrent stages of the order pipeline
+ORDER_FANOUT_WORKERS = int(os.getenv("ORDER_FANOUT_WORKERS", "32"))
+
+tracer = trace.get_tracer(__name__)
+executor = ThreadPoolExecutor(max_workers=ORDER_FANOUT_WORKERS, thread_name_prefix="order-fanout")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Budget:
+    """Deadline for a whole order; every downstream call gets at most what is left of it."""
+
+    def __init__(self, seconds: float = ORDER_REQUEST_BUDGET):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, call_timeout: float) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(call_timeout, remaining)
+
+
+def run_stage(name: str, fn, *args):
+    """Run one pipeline stage inside its own child span."""
+    with tracer.start_as_current_span(name):
+        return fn(*args)
+
+
+def fan_out(budget: Budget, stages: dict, late=None) -> dict:
+    """
+    Run independent stages (name -> callable) concurrently and return name -> result.
+    The first stage runs on the calling thread, so it is the place for work bound to
+    the caller such as the database session; it always runs to completion. Stages
+    that are not done within the budget get `late` as their result, or raise
+    DeadlineExceeded if `late` is None.
+    """
+    (first_name, first), *others = stages.items()
+    # copy_context keeps the request span as the parent of the stage spans
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, run_stage, name, fn)
+        for name, fn in others
+    }
+    results = {first_name: run_stage(first_name, first)}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=budget.remaining())
+        except (FutureTimeoutError, DeadlineExceeded):
+            if late is None:
+                raise DeadlineExceeded()
+            results[name] = late
+    return results
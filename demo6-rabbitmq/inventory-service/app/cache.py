@@ -0,0 +1,91 @@
+import os
+import time
+from collections import OrderedDict
+from opentelemetry.metrics import get_meter_provider
+
+# Cache configuration from environment (size 0 disables the cache)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "30"))
+
+# ==========================
+# Initialize Metrics
+# ==========================
+
+meter = get_meter_provider().get_meter("custom-metrics", "1.0.0")
+
+cache_hit_counter = meter.create_counter(
+    "product_cache_hits",
+    description="Product lookups served from the in-process cache",
+)
+cache_miss_counter = meter.create_counter(
+    "product_cache_misses",
+    description="Product lookups that had to query MongoDB",
+)
+cache_eviction_counter = meter.create_counter(
+    "product_cache_evictions",
+    description="Products dropped from the cache because of size, TTL or writes",
+)
+
+
+class ProductCache:
+    """
+    LRU cache of product documents with a TTL, addressable by id and by name.
+
+    Entries are stored once per product id; the name index only points at ids
+    that are cached, so invalidating an id also drops its name mapping.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._names: dict[str, str] = {}
+        # Bumped on every invalidation; loads started before a write are not cached
+        self.version = 0
+
+    def get_by_id(self, product_id: str, lookup: str = "id") -> dict | None:
+        entry = self._entries.get(product_id)
+        if entry is not None:
+            expires_at, product = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(product_id)
+                cache_hit_counter.add(1, {"lookup": lookup})
+                return product
+            self._drop(product_id, "ttl")
+        cache_miss_counter.add(1, {"lookup": lookup})
+        return None
+
+    def get_by_name(self, name: str) -> dict | None:
+        product_id = self._names.get(name)
+        if product_id is None:
+            cache_miss_counter.add(1, {"lookup": "name"})
+            return None
+        return self.get_by_id(product_id, lookup="name")
+
+    def put(self, product: dict, version: int) -> None:
+        if self.maxsize <= 0 or version != self.version:
+            return
+        product_id = str(product["_id"])
+        self._entries[product_id] = (time.monotonic() + self.ttl, product)
+        self._entries.move_to_end(product_id)
+        self._names[product["name"]] = product_id
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)), "size")
+
+    def invalidate(self, product_id: str | None = None, name: str | None = None) -> None:
+        self.version += 1
+        if name is not None and product_id is None:
+            product_id = self._names.get(name)
+        if product_id is not None and product_id in self._entries:
+            self._drop(product_id, "write")
+        if name is not None:
+            self._names.pop(name, None)
+
+    def _drop(self, product_id: str, reason: str) -> None:
+        _, product = self._entries.pop(product_id)
+        if self._names.get(product["name"]) == product_id:
+            del self._names[product["name"]]
+        cache_eviction_counter.add(1, {"reason": reason})
+
+
+product_cache = ProductCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
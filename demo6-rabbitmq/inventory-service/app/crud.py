@@ -1,13 +1,29 @@
+import base64
+import binascii
+import json
 import logging
+import os
 import time
 from .models import Product
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
 from fastapi import HTTPException
-from .database import products_collection  # Import the PyMongo collection
+from .database import products_collection  # Import the Motor collection
+from .database import client as mongo_client
+from .cache import product_cache
 from .messaging import client
 
 logger = logging.getLogger(__name__)
 
+# Documents fetched per Mongo round trip while streaming the catalog
+STREAM_BATCH_SIZE = int(os.getenv("PRODUCTS_STREAM_BATCH_SIZE", "500"))
+
+
+class InsufficientStock(Exception):
+    """A reservation line did not match; aborts the reservation transaction."""
+
+
 # ==========================
 # Helper functions
 # ==========================
@@ -26,6 +42,47 @@ def avaiability_helper(product, isAvaiable) -> dict:
         "available": isAvaiable
     }
 
+# Update pipeline that subtracts `quantity` only when enough stock is left,
+# so the check and the decrement happen in one atomic server-side operation
+def conditional_decrement(quantity: int) -> list:
+    return [{"$set": {"quantity": {"$cond": [
+        {"$gte": ["$quantity", quantity]},
+        {"$subtract": ["$quantity", quantity]},
+        "$quantity",
+    ]}}}]
+
+# Opaque keyset cursor: the url-safe base64 of the last returned ObjectId
+def encode_cursor(product_id: str) -> str:
+    return base64.urlsafe_b64encode(ObjectId(product_id).binary).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def products_query(cursor: str | None) -> dict:
+    return {"_id": {"$gt": decode_cursor(cursor)}} if cursor else {}
+
+# Read-through lookups in front of products_collection
+async def find_product_by_id(product_id: str) -> dict | None:
+    product = product_cache.get_by_id(product_id)
+    if product is None:
+        version = product_cache.version
+        product = await products_collection.find_one({"_id": ObjectId(product_id)})
+        if product is not None:
+            product_cache.put(product, version)
+    return product
+
+async def find_product_by_name(product_name: str) -> dict | None:
+    product = product_cache.get_by_name(product_name)
+    if product is None:
+        version = product_cache.version
+        product = await products_collection.find_one({"name": product_name})
+        if product is not None:
+            product_cache.put(product, version)
+    return product
+
 
 # ==========================
 # API HANDLERS
@@ -37,7 +94,7 @@ async def get_product(product_id: str) -> dict:
     logger.warn(f"Querying product with ID: {product_id}")
     start_time = time.time()
     
-    product = products_collection.find_one(query)
+    product = await find_product_by_id(product_id)
     elapsed_time = time.time() - start_time
     logger.warn(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
     
@@ -51,13 +108,12 @@ async def get_product(product_id: str) -> dict:
 async def check_availability(product_name: str, quantity: int) -> dict:
     logger.warn(f"Checking availability for product with name: {product_name}")
     
-    query = {"name": product_name}
-    product = products_collection.find_one(query)
+    product = await find_product_by_name(product_name)
     if product is not None:
         if product["quantity"] >= quantity:
             return avaiability_helper(product, True)
         else:
-            await client.send_request(product["name"], product["quantity"], quantity)
+            client.request_restock(product["name"], product["quantity"], quantity)
             return avaiability_helper(product, False)
     else:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -69,26 +125,69 @@ async def reduce_quantity(product_name: str, quantity: int) -> dict:
     if quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
 
-    # Find the product by name
-    product = products_collection.find_one({"name": product_name})
-    logger.warn(f"Product found: {product}")
+    # Check and reduce the stock in a single round trip. The pre-update document
+    # tells "not found" (None) apart from "not enough stock" (quantity unchanged)
+    product = await products_collection.find_one_and_update(
+        {"name": product_name},  # Find the product by name
+        conditional_decrement(quantity),  # Reduce only if enough stock is left
+        return_document=ReturnDocument.BEFORE
+    )
 
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Ensure the product has enough quantity to reduce
     if product["quantity"] < quantity:
+        # Orders reserve stock directly, so a rejection here also asks for a restock
+        client.request_restock(product["name"], product["quantity"], quantity)
         raise HTTPException(status_code=400, detail="Not enough stock to reduce")
 
-    # Reduce the quantity by the given amount
-    updated_product = products_collection.find_one_and_update(
-        {"name": product_name},  # Find the product by name
-        {"$inc": {"quantity": -quantity}},  # Reduce the quantity by the specified amount
-        return_document=True  # Return the updated document
-    )
-    logger.warn(f"Product updated: {updated_product}")
+    product_cache.invalidate(product_id=str(product["_id"]), name=product_name)
+    product["quantity"] -= quantity
+    logger.warn(f"Product updated: {product}")
 
-    return product_helper(updated_product)
+    return product_helper(product)
+
+
+# Reserve stock for a whole basket with one bulk write inside a transaction
+async def reserve_products(items: list) -> dict:
+    logger.warn(f"Reserving stock for {len(items)} products")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No items to reserve")
+
+    # Ensure every quantity to reserve is a positive integer
+    if any(item.quantity <= 0 for item in items):
+        raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
+
+    # Each line only matches when the product has enough stock left
+    operations = [
+        UpdateOne(
+            {"name": item.name, "quantity": {"$gte": item.quantity}},
+            {"$inc": {"quantity": -item.quantity}}
+        )
+        for item in items
+    ]
+
+    async def reserve(session):
+        result = await products_collection.bulk_write(operations, ordered=True, session=session)
+        logger.warn(f"Reservation matched {result.matched_count} of {len(operations)} products")
+
+        # Raising inside the transaction aborts it, so no line is applied
+        if result.matched_count < len(operations):
+            raise InsufficientStock()
+
+    # with_transaction retries on TransientTransactionError and UnknownTransactionCommitResult
+    # (write conflicts, failovers); a stock shortfall is not retried
+    try:
+        async with await mongo_client.start_session() as session:
+            await session.with_transaction(reserve)
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Not enough stock to reserve all items")
+
+    for item in items:
+        product_cache.invalidate(name=item.name)
+
+    return {"items": [{"name": item.name, "quantity": item.quantity} for item in items]}
 
 
 async def increase_quantity(product_name: str, quantity: int) -> dict:
@@ -99,35 +198,75 @@ async def increase_quantity(product_name: str, quantity: int) -> dict:
         raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
 
     # Find the product by name
-    product = products_collection.find_one({"name": product_name})
+    product = await products_collection.find_one({"name": product_name})
     logger.warn(f"Product found: {product}")
 
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Reduce the quantity by the given amount
-    updated_product = products_collection.find_one_and_update(
+    updated_product = await products_collection.find_one_and_update(
         {"name": product_name},  # Find the product by name
         {"$inc": {"quantity": quantity}},  # Reduce the quantity by the specified amount
         return_document=True  # Return the updated document
     )
+    product_cache.invalidate(product_id=str(product["_id"]), name=product_name)
     logger.warn(f"Product updated: {updated_product}")
 
     return product_helper(updated_product)
 
+# Apply many restocks ({product name: quantity to add}) in one round trip.
+# Returns how many of the products exist.
+async def increase_quantities(increments: dict[str, int]) -> int:
+    operations = [
+        UpdateOne({"name": name}, {"$inc": {"quantity": quantity}})
+        for name, quantity in increments.items()
+    ]
+    result = await products_collection.bulk_write(operations, ordered=False)
+    for name in increments:
+        product_cache.invalidate(name=name)
+    if result.matched_count < len(operations):
+        logger.warn(f"Restock matched {result.matched_count} of {len(operations)} products")
+    return result.matched_count
+
+async def find_products_by_names(names) -> dict[str, dict]:
+    find = products_collection.find({"name": {"$in": list(names)}})
+    return {product["name"]: product_helper(product) async for product in find}
+
 # Get a list of all products
-async def get_products(skip: int = 0, limit: int = 100) -> list:
-    query = {}
+# Pages are ordered by _id; with a cursor the page starts right after it (keyset),
+# otherwise the legacy skip offset is applied. Returns the page and the next cursor.
+async def get_products(skip: int = 0, limit: int = 100, cursor: str | None = None) -> tuple[list, str | None]:
+    query = products_query(cursor)
     logger.debug("Hola debug")
-    logger.info(f"Querying all products with skip={skip} and limit={limit}")
+    logger.info(f"Querying all products with skip={skip}, limit={limit} and cursor={cursor}")
     start_time = time.time()
     
-    products = products_collection.find(query).skip(skip).limit(limit)
+    find = products_collection.find(query).sort("_id", 1)
+    if not cursor and skip:
+        find = find.skip(skip)
+    products = [product_helper(product) async for product in find.limit(limit)]
     elapsed_time = time.time() - start_time
     logger.warn(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
     logger.error("try out errors too")
     
-    return [product_helper(product) for product in products]
+    next_cursor = None
+    if limit > 0 and len(products) == limit:
+        next_cursor = encode_cursor(products[-1]["id"])
+    return products, next_cursor
+
+# Stream products as NDJSON lines while the Mongo cursor produces them (limit 0 = whole catalog).
+# The cursor is decoded eagerly so an invalid one fails before the response starts.
+def stream_products(limit: int = 0, cursor: str | None = None):
+    query = products_query(cursor)
+    logger.info(f"Streaming products with limit={limit} and cursor={cursor}")
+
+    find = products_collection.find(query).sort("_id", 1).limit(limit).batch_size(STREAM_BATCH_SIZE)
+    return ndjson_lines(find)
+
+async def ndjson_lines(find):
+    async for product in find:
+        yield json.dumps(product_helper(product)) + "\n"
 
 # Create a new product
 async def create_product(product: Product) -> dict:
@@ -135,11 +274,12 @@ async def create_product(product: Product) -> dict:
     logger.warn("Inserting new product")
     start_time = time.time()
     
-    result = products_collection.insert_one(product_dict)
+    result = await products_collection.insert_one(product_dict)
+    product_cache.invalidate(name=product_dict["name"])
     elapsed_time = time.time() - start_time
     logger.warn(f"Inserted new product with ID: {result.inserted_id} in {elapsed_time:.4f} seconds")
     
-    new_product = products_collection.find_one({"_id": result.inserted_id})
+    new_product = await products_collection.find_one({"_id": result.inserted_id})
     return product_helper(new_product)
 
 # Update an existing product
@@ -149,14 +289,15 @@ async def update_product(product_id: str, product: Product) -> dict:
     logger.warn(f"Updating product with ID: {product_id}")
     start_time = time.time()
     
-    result = products_collection.update_one(query, {"$set": product_dict})
+    result = await products_collection.update_one(query, {"$set": product_dict})
+    product_cache.invalidate(product_id=product_id, name=product_dict.get("name"))
     elapsed_time = time.time() - start_time
     logger.warn(f"Update query executed in {elapsed_time:.4f} seconds with query: {query}")
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    updated_product = products_collection.find_one(query)
+    updated_product = await products_collection.find_one(query)
     return product_helper(updated_product)
 
 # Delete a product
@@ -165,7 +306,8 @@ async def delete_product(product_id: str) -> dict:
     logger.warn(f"Deleting product with ID: {product_id}")
     start_time = time.time()
     
-    result = products_collection.delete_one(query)
+    result = await products_collection.delete_one(query)
+    product_cache.invalidate(product_id=product_id)
     elapsed_time = time.time() - start_time
     logger.warn(f"Delete query executed in {elapsed_time:.4f} seconds with query: {query}")
     
@@ -177,11 +319,10 @@ async def delete_product(product_id: str) -> dict:
 # Get the quantity of a product by ID
 async def get_product_quantity(product_id: str) -> dict:
     query = {"_id": ObjectId(product_id)}
-    projection = {"quantity": 1}
     logger.warn(f"Querying quantity of product with ID: {product_id}")
     start_time = time.time()
     
-    product = products_collection.find_one(query, projection)
+    product = await find_product_by_id(product_id)
     elapsed_time = time.time() - start_time
     logger.warn(f"Query executed in {elapsed_time:.4f} seconds with query: {query}")
     
@@ -1,13 +1,86 @@
 import os
-from pymongo import MongoClient
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/inventorydb")
+# Connection pool bounds for the async driver
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
 
-# Initialize PyMongo
-client = MongoClient(MONGO_URI)
+# Initialize Motor (non-blocking PyMongo wrapper); every collection call must be awaited
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+)
 db = client["inventorydb"]
 products_collection = db["products"]
+
+# Indexes the crud hot paths rely on: every name-based lookup, reservation and
+# restock filters on "name", so it must never fall back to a collection scan
+PRODUCT_INDEXES = [
+    IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+]
+
+
+async def ensure_indexes() -> dict:
+    """
+    Create the declared product indexes that are missing and report declared
+    indexes stored without their options. Errors are logged, not raised, so
+    that an unreachable or restricted database does not abort startup.
+    """
+    report = {"created": [], "mismatched": []}
+    try:
+        existing = await products_collection.index_information()
+    except PyMongoError as e:
+        logger.error(f"Failed to read product indexes: {e}")
+        return report
+    existing_by_key = {tuple(info["key"]): (name, info) for name, info in existing.items()}
+
+    missing = []
+    for index in PRODUCT_INDEXES:
+        spec = index.document
+        key = tuple(spec["key"].items())
+        if key not in existing_by_key:
+            missing.append(index)
+        elif spec.get("unique") and not existing_by_key[key][1].get("unique"):
+            report["mismatched"].append(existing_by_key[key][0])
+
+    if missing:
+        try:
+            report["created"] = await products_collection.create_indexes(missing)
+        except OperationFailure as e:
+            # e.g. duplicate names already stored; keep serving and surface it
+            logger.error(f"Failed to create product indexes: {e}")
+
+    logger.info(f"Product index report: {report}")
+    if report["mismatched"]:
+        logger.warning(f"Indexes without the required unique option: {report['mismatched']}")
+    return report
+
+
+async def index_usage() -> dict:
+    """
+    Report product indexes that are not declared here or have not served any
+    operation since the server started ($indexStats counts per mongod, from its
+    start), e.g. to find candidates to drop after the service has taken traffic.
+    """
+    declared_keys = {tuple(index.document["key"].items()) for index in PRODUCT_INDEXES}
+    report = {"undeclared": [], "unused": [], "accesses": {}}
+    async for stats in products_collection.aggregate([{"$indexStats": {}}]):
+        if stats["name"] == "_id_":
+            continue
+        report["accesses"][stats["name"]] = stats["accesses"]["ops"]
+        if tuple(stats["key"].items()) not in declared_keys:
+            report["undeclared"].append(stats["name"])
+        if stats["accesses"]["ops"] == 0:
+            report["unused"].append(stats["name"])
+    return report
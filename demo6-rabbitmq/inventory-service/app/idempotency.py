@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from opentelemetry.metrics import get_meter_provider
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+# Recorded responses are replayed for IDEMPOTENCY_TTL seconds; the in-process store keeps
+# at most IDEMPOTENCY_CACHE_SIZE keys. "mongo" also records them in MongoDB so that
+# replays are recognised by every replica and survive restarts.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_BACKING = os.getenv("IDEMPOTENCY_BACKING", "memory")  # memory | mongo
+# A pending claim whose request has not finished after IDEMPOTENCY_LEASE seconds (e.g. the
+# replica crashed) is taken over by the next request with the same key
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "60"))
+
+idempotency_collection = db["idempotency_keys"]
+
+meter = get_meter_provider().get_meter("custom-metrics", "1.0.0")
+
+replay_counter = meter.create_counter(
+    "idempotent_replays",
+    description="Requests answered with the response recorded for their Idempotency-Key",
+)
+
+
+class IdempotencyStore:
+    """
+    Bounded LRU of idempotency records with a TTL, optionally backed by a Mongo
+    collection. A record is {"fingerprint", "state": "pending" | "done",
+    "status_code", "body"}; "pending" means the first request is still running.
+    Pending claims expire after `lease` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, lease: float, collection=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lease = lease
+        self.collection = collection
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def claim(self, key: str, fingerprint: str) -> dict | None:
+        """Reserve `key` for a new request; returns the existing record if there is one."""
+        record = self._get(key)
+        if record is not None:
+            return record
+        record = {"fingerprint": fingerprint, "state": "pending"}
+        if self.collection is not None:
+            now = datetime.now(timezone.utc)
+            try:
+                # The unique _id makes the claim atomic across replicas
+                await self.collection.insert_one({"_id": key, **record, "created_at": now})
+            except DuplicateKeyError:
+                # Take over a claim whose lease has run out; only one request can replace it
+                taken_over = await self.collection.find_one_and_replace(
+                    {"_id": key, "state": "pending", "created_at": {"$lt": now - timedelta(seconds=self.lease)}},
+                    {**record, "created_at": now},
+                )
+                if taken_over is None:
+                    existing = await self.collection.find_one({"_id": key}, {"_id": 0, "created_at": 0})
+                    if existing is not None:
+                        return existing
+        self._put(key, record, self.lease)
+        return None
+
+    async def complete(self, key: str, status_code: int, body) -> None:
+        record = self._get(key) or {}
+        record.update(state="done", status_code=status_code, body=body)
+        self._put(key, record, self.ttl)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"_id": key}, {"$set": {"state": "done", "status_code": status_code, "body": body}}
+            )
+
+    async def release(self, key: str) -> None:
+        """Forget a claim whose request failed, so that a retry runs it again."""
+        self._entries.pop(key, None)
+        if self.collection is not None:
+            await self.collection.delete_one({"_id": key, "state": "pending"})
+
+    def _get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return record
+
+    def _put(self, key: str, record: dict, ttl: float) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, record)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+store = IdempotencyStore(
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_TTL,
+    IDEMPOTENCY_LEASE,
+    idempotency_collection if IDEMPOTENCY_BACKING == "mongo" else None,
+)
+
+
+async def ensure_idempotency_indexes() -> None:
+    """Let MongoDB expire recorded keys after IDEMPOTENCY_TTL (mongo backing only)."""
+    if store.collection is None:
+        return
+    await store.collection.create_indexes(
+        [IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=IDEMPOTENCY_TTL)]
+    )
+
+
+async def idempotent(key: str | None, scope: str, request: dict, handler):
+    """
+    Run `handler` once per Idempotency-Key. Replays get the recorded response,
+    including 4xx errors; 5xx errors are not recorded so that they can be retried.
+    """
+    if key is None:
+        return await handler()
+
+    scoped_key = f"{scope}:{key}"
+    fingerprint = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+    record = await store.claim(scoped_key, fingerprint)
+    if record is not None:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+        if record["state"] == "pending":
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+        replay_counter.add(1, {"scope": scope})
+        logger.info(f"Replaying recorded response for {scoped_key}")
+        return JSONResponse(record["body"], status_code=record["status_code"], headers={"Idempotent-Replayed": "true"})
+
+    try:
+        result = await handler()
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await store.release(scoped_key)
+        else:
+            await store.complete(scoped_key, e.status_code, {"detail": e.detail})
+        raise
+    except BaseException:
+        await store.release(scoped_key)
+        raise
+    await store.complete(scoped_key, 200, jsonable_encoder(result))
+    return result
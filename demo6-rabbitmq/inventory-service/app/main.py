@@ -1,16 +1,33 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pymongo.errors import PyMongoError
 from . import crud, models
 import time
 import logging
 import os
 from .messaging import client
+from .database import client as mongo_client, ensure_indexes, index_usage
+from .idempotency import ensure_idempotency_indexes, idempotent
+from otel_flush import flush_telemetry  # Shared telemetry flush (demo root)
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mongo (index check doubles as warm-up query) and RabbitMQ are independent,
+    # so both are brought up concurrently
+    await asyncio.gather(ensure_indexes(), ensure_idempotency_indexes(), client.connect())
+    logger.info("Inventory service ready")
+    yield
+    # Runs on SIGTERM: stop consuming, release connections, flush telemetry within its deadline
+    await client.close()
+    mongo_client.close()
+    await asyncio.to_thread(flush_telemetry)
+
+app = FastAPI(lifespan=lifespan)
 
-@app.on_event("startup")
-async def startup():
-    await client.connect()
-    
 
 # Create a product
 @app.post("/products/", response_model=models.ProductInResponse)
@@ -34,14 +51,49 @@ async def check_availability(
 @app.post("/products/{product_name}/reduce-quantity", response_model=models.ProductInResponse)
 async def reduce_quantity(
     product_name: str,
-    reduce_quantity_request: models.ReduceQuantityRequest
+    reduce_quantity_request: models.ReduceQuantityRequest,
+    idempotency_key: str | None = Header(None, description="Retries with the same key replay the first response")
+):
+    return await idempotent(
+        idempotency_key,
+        "reduce-quantity",
+        {"name": product_name, "quantity": reduce_quantity_request.quantity},
+        lambda: crud.reduce_quantity(product_name, reduce_quantity_request.quantity),
+    )
+
+# Reserve stock for several products at once (all-or-nothing)
+@app.post("/products/reserve", response_model=models.ReserveResponse)
+async def reserve_products(
+    reserve_request: models.ReserveRequest,
+    idempotency_key: str | None = Header(None, description="Retries with the same key replay the first response")
 ):
-    return await crud.reduce_quantity(product_name, reduce_quantity_request.quantity)
+    return await idempotent(
+        idempotency_key,
+        "reserve",
+        reserve_request.dict(),
+        lambda: crud.reserve_products(reserve_request.items),
+    )
+
+# Pages are capped at PRODUCTS_PAGE_MAX_LIMIT; only the NDJSON stream may read the
+# whole catalog (limit=0)
+PRODUCTS_PAGE_MAX_LIMIT = int(os.getenv("PRODUCTS_PAGE_MAX_LIMIT", "1000"))
 
 # List all products
 @app.get("/products/", response_model=list[models.ProductInResponse])
-async def read_products(skip: int = 0, limit: int = 100):
-    return await crud.get_products(skip, limit)
+async def read_products(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, description="Page size; with stream=true, 0 streams the whole catalog"),
+    cursor: str | None = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    stream: bool = Query(False, description="Stream products as NDJSON instead of returning a page")
+):
+    if not stream and not 1 <= limit <= PRODUCTS_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {PRODUCTS_PAGE_MAX_LIMIT}; use stream=true for larger reads")
+    if stream:
+        return StreamingResponse(crud.stream_products(limit, cursor), media_type="application/x-ndjson")
+    products, next_cursor = await crud.get_products(skip, limit, cursor)
+    # Products are already plain dicts, so skip re-validating them against the response model
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(products, headers=headers)
 
 # Update a product by ID
 @app.put("/products/{product_id}", response_model=models.ProductInResponse)
@@ -53,6 +105,15 @@ async def update_product(product_id: str, product: models.Product):
 async def delete_product(product_id: str):
     return await crud.delete_product(product_id)
 
+# Undeclared and unused product indexes, read on demand once the service has taken traffic
+@app.get("/admin/index-usage")
+async def get_index_usage():
+    try:
+        return await index_usage()
+    except PyMongoError as e:
+        logger.error(f"Failed to read product index usage: {e}")
+        raise HTTPException(status_code=503, detail="Index usage is not available")
+
 # Get the quantity of a product by ID
 @app.get("/products/{product_id}/quantity")
 async def get_product_quantity(product_id: str):
@@ -19,4 +19,15 @@ class AvailableResponse(BaseModel):
     available: bool
 
 class ReduceQuantityRequest(BaseModel):
-    quantity: int
\ No newline at end of file
+    quantity: int
+
+# A single line of a bulk stock reservation
+class ReservationLine(BaseModel):
+    name: str
+    quantity: int
+
+class ReserveRequest(BaseModel):
+    items: list[ReservationLine]
+
+class ReserveResponse(BaseModel):
+    items: list[ReservationLine]
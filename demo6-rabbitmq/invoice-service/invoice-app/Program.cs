@@ -1,3 +1,5 @@
+using System.Security.Cryptography;
+using System.Text;
 using Microsoft.AspNetCore.Mvc;
 using Microsoft.EntityFrameworkCore;
 using OpenTelemetry;
@@ -49,13 +51,40 @@ using (var scope = app.Services.CreateScope())
 }
 
 // API Endpoints
-app.MapPost("/invoices", async ([FromBody] Invoice invoice, InvoiceDbContext db, ILogger<Program> logger) =>
+// Requests with the same Idempotency-Key (e.g. outbox redeliveries) map to the same
+// invoice id, so a retry returns the invoice created the first time
+app.MapPost("/invoices", async ([FromBody] Invoice invoice, [FromHeader(Name = "Idempotency-Key")] string? idempotencyKey,
+    InvoiceDbContext db, ILogger<Program> logger) =>
 {
-    invoice.Id = Guid.NewGuid();
+    if (idempotencyKey is null)
+    {
+        invoice.Id = Guid.NewGuid();
+    }
+    else
+    {
+        invoice.Id = new Guid(MD5.HashData(Encoding.UTF8.GetBytes(idempotencyKey)));
+        var existing = await db.Invoices.FindAsync(invoice.Id);
+        if (existing is not null)
+        {
+            logger.LogInformation("Invoice {InvoiceId} already created for Idempotency-Key {IdempotencyKey}", existing.Id, idempotencyKey);
+            return Results.Ok(existing);
+        }
+    }
     logger.LogInformation("Creating a new invoice for {CustomerName}, Amount: {Amount}", invoice.CustomerName, invoice.Amount);
     
     db.Invoices.Add(invoice);
-    await db.SaveChangesAsync();
+    try
+    {
+        await db.SaveChangesAsync();
+    }
+    catch (DbUpdateException) when (idempotencyKey is not null)
+    {
+        // A concurrent request with the same key inserted the invoice first
+        db.ChangeTracker.Clear();
+        var existing = await db.Invoices.FindAsync(invoice.Id);
+        if (existing is null) throw;
+        return Results.Ok(existing);
+    }
     
     logger.LogInformation("Invoice {InvoiceId} created successfully", invoice.Id);
     return Results.Created($"/invoices/{invoice.Id}", invoice);
@@ -1,11 +1,25 @@
+import json
 import logging
 import os
+import httpx
 import requests
+from opentelemetry.propagate import inject
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .models import Order
+from .database import AsyncSessionLocal, SessionLocal
+from .models import Order, OutboxEvent
+from .http_client import async_session, session
+from .pipeline import (
+    INVENTORY_CALL_TIMEOUT, INVOICE_CALL_TIMEOUT, ORDER_REQUEST_BUDGET,
+    Budget, DeadlineExceeded, fan_out, fan_out_async, run_stage, run_stage_async
+)
 import random
 from datetime import datetime, timedelta
 import uuid
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -14,67 +28,446 @@ logger = logging.getLogger(__name__)
 INVENTORY_SERVICE_URL = os.getenv("INVENTORY_SERVICE_URL", "http://inventory-service:8000")
 INVOICE_SERVICE_URL = os.getenv("INVOICE_SERVICE_URL", "http://invoice-service:8003")
 
+# Compatibility flag: check /availability first and then reduce stock (two inventory
+# calls) instead of a single reserve-or-reject call
+LEGACY_AVAILABILITY_CHECK = os.getenv("ORDER_LEGACY_AVAILABILITY_CHECK", "false").lower() == "true"
 
-def create_order(db: Session, item_name: str, quantity: int):
-    logger.info(f"Checking inventory for item: {item_name}, quantity: {quantity}")
-    
-    # Check inventory availability
-    try:
-        response = requests.get(
-            f"{INVENTORY_SERVICE_URL}/products/{item_name}/availability", 
-            params={"quantity": quantity}
-        )
+DEADLINE_ERROR = {"error": "Order deadline exceeded"}
+# Result of an invoice call still running when the order budget runs out
+INVOICE_LATE = {"error": "Invoice not confirmed within the order deadline"}
+
+# Accept orders with a single local commit: stock reduction and invoicing are written to
+# the order_outbox table and delivered by the background dispatcher (app/outbox.py).
+# Takes precedence over LEGACY_AVAILABILITY_CHECK; stock is no longer checked before accepting,
+# so orders are stored "pending" and confirmed or rejected once the stock event is delivered.
+ORDER_OUTBOX_ENABLED = os.getenv("ORDER_OUTBOX_ENABLED", "false").lower() == "true"
+
+# Rows fetched per round trip by the server-side cursor of the streaming listing
+ORDERS_STREAM_BATCH_SIZE = int(os.getenv("ORDERS_STREAM_BATCH_SIZE", "500"))
+# Listings select plain columns, so rows skip ORM instance construction and the identity map
+ORDER_COLUMNS = (Order.id, Order.item_name, Order.quantity, Order.created_at, Order.status)
+
+
+def build_invoice_data():
+    return {
+        "CustomerName": f"Customer-{random.randint(1000, 9999)}",
+        "Amount": round(random.uniform(10.0, 500.0), 2),
+        "DueDate": (datetime.utcnow() + timedelta(days=random.randint(7, 30))).isoformat()
+    }
+
+
+def with_warnings(created, results: dict):
+    """
+    Response of committed orders. Calls that failed after the commit (the invoice)
+    no longer turn the response into an error: the orders exist and a retry would
+    place them again, so their errors are reported as warnings next to the orders.
+    """
+    warnings = [result["error"] for name, result in results.items() if name != "order.store" and result is not None]
+    if not warnings:
+        return created
+    logger.warning(f"Orders stored with failed follow-up calls: {warnings}")
+    if isinstance(created, list):
+        return [{**order, "warnings": warnings} for order in created]
+    return {
+        "id": created.id, "item_name": created.item_name, "quantity": created.quantity,
+        "created_at": created.created_at, "status": created.status, "warnings": warnings,
+    }
+
+
+# Orders are listed by id; with a cursor (the last id of the previous page) the
+# page starts right after it (keyset), so no rows are skipped server side
+def orders_query(limit: int = 0, cursor: int | None = None, item_name: str | None = None,
+                 created_from: datetime | None = None, created_to: datetime | None = None):
+    stmt = select(*ORDER_COLUMNS).order_by(Order.id)
+    if cursor is not None:
+        stmt = stmt.where(Order.id > cursor)
+    if item_name is not None:
+        stmt = stmt.where(Order.item_name == item_name)
+    if created_from is not None:
+        stmt = stmt.where(Order.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(Order.created_at < created_to)
+    if limit > 0:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def order_row(row) -> dict:
+    order = row._asdict()
+    if order["created_at"] is not None:
+        order["created_at"] = order["created_at"].isoformat()
+    return order
+
+
+def next_cursor(orders: list, limit: int) -> int | None:
+    return orders[-1]["id"] if limit > 0 and len(orders) == limit else None
+
+
+def outbox_event(order_id: int, event_type: str, payload: dict) -> OutboxEvent:
+    trace_context = {}
+    inject(trace_context)
+    return OutboxEvent(order_id=order_id, event_type=event_type, payload=payload, trace_context=trace_context)
+
+
+# The invoice rides along with the stock event: the dispatcher queues send_invoice
+# only once the stock change has been delivered (see outbox.py)
+def order_events(order: Order) -> list:
+    return [
+        outbox_event(order.id, "reduce_inventory", {
+            "item_name": order.item_name, "quantity": order.quantity, "invoice": build_invoice_data()
+        }),
+    ]
+
+
+def batch_events(orders: list) -> list:
+    # One all-or-nothing reservation (and then one invoice) for the basket, keyed by its
+    # first order; order_ids lists the orders the dispatcher confirms or rejects with it
+    items = [{"name": order.item_name, "quantity": order.quantity} for order in orders]
+    return [
+        outbox_event(orders[0].id, "reserve_items", {
+            "items": items, "order_ids": [order.id for order in orders], "invoice": build_invoice_data()
+        }),
+    ]
+
+
+# ==========================
+# Order pipeline stages
+# ==========================
+# Every downstream call is described once as a ServiceCall; call() sends it with
+# requests and call_async() with httpx (ORDER_ASYNC_MODE), so the two modes only
+# differ in their I/O. A call returns None on success and an error dict on failure.
+# The inventory stages gate the order and run first: nothing is stored unless the
+# stock is held. Storing the order then always runs to completion, with the
+# invoice sent concurrently (fan_out); its failure only adds a warning.
+
+def raise_for_status(response):
+    response.raise_for_status()
+    return None
+
+
+def reject_unavailable(response):
+    # 404 (unknown product) and 400 (not enough stock) are both a rejection
+    if response.status_code in (400, 404):
+        logger.warning(f"Items not available in requested quantities: {response.text}")
+        return {"error": "Item not available"}
+    response.raise_for_status()
+    return None
+
+
+@dataclass
+class ServiceCall:
+    action: str  # for logs, e.g. "reserve inventory"
+    method: str
+    url: str
+    timeout: float  # cap for this call; the order budget may leave less
+    error: dict  # returned when the call fails
+    read: Callable = raise_for_status  # reads a response: an error dict or None
+    params: dict | None = None
+    json: dict | None = None
+    headers: dict | None = None
+
+
+def check_availability(item_name: str, quantity: int) -> ServiceCall:
+    def read(response):
         response.raise_for_status()
-        inventory_data = response.json()
-        if not inventory_data.get("available", False):
+        if not response.json().get("available", False):
             logger.warning(f"Item {item_name} is not available in requested quantity: {quantity}")
             return {"error": "Item not available"}
+        return None
+    return ServiceCall(
+        "check inventory", "GET", f"{INVENTORY_SERVICE_URL}/products/{item_name}/availability",
+        INVENTORY_CALL_TIMEOUT, {"error": "Inventory check failed"}, read, params={"quantity": quantity},
+    )
+
+
+# The client's Idempotency-Key is passed on to the stock calls: a retry after a
+# reservation whose response was lost replays it instead of taking the stock twice
+def idempotency_headers(idempotency_key: str | None) -> dict | None:
+    return {"Idempotency-Key": f"order-{idempotency_key}"} if idempotency_key else None
+
+
+def reserve_inventory(item_name: str, quantity: int, idempotency_key: str | None = None) -> ServiceCall:
+    """Check and reduce stock with one atomic inventory call."""
+    return ServiceCall(
+        "reserve inventory", "POST", f"{INVENTORY_SERVICE_URL}/products/{item_name}/reduce-quantity",
+        INVENTORY_CALL_TIMEOUT, {"error": "Inventory reservation failed"}, reject_unavailable,
+        json={"quantity": quantity}, headers=idempotency_headers(idempotency_key),
+    )
+
+
+def reserve_items(items: list, idempotency_key: str | None = None) -> ServiceCall:
+    """Reserve every line with a single all-or-nothing inventory call."""
+    return ServiceCall(
+        "reserve inventory", "POST", f"{INVENTORY_SERVICE_URL}/products/reserve",
+        INVENTORY_CALL_TIMEOUT, {"error": "Inventory reservation failed"}, reject_unavailable,
+        json={"items": [{"name": item.item_name, "quantity": item.quantity} for item in items]},
+        headers=idempotency_headers(idempotency_key),
+    )
+
+
+def reduce_inventory(item_name: str, quantity: int, idempotency_key: str | None = None) -> ServiceCall:
+    return ServiceCall(
+        "reduce inventory", "POST", f"{INVENTORY_SERVICE_URL}/products/{item_name}/reduce-quantity",
+        INVENTORY_CALL_TIMEOUT, {"error": "Inventory reduction failed"}, json={"quantity": quantity},
+        headers=idempotency_headers(idempotency_key),
+    )
+
+
+def send_invoice(invoice_data: dict) -> ServiceCall:
+    return ServiceCall(
+        "create invoice", "POST", f"{INVOICE_SERVICE_URL}/invoices",
+        INVOICE_CALL_TIMEOUT, {"error": "Invoice creation failed"}, json=invoice_data,
+    )
+
+
+def inventory_stages(item_name: str, quantity: int, idempotency_key: str | None = None) -> list[tuple[str, ServiceCall]]:
+    """The gating inventory stages of a single-item order, run one after the other."""
+    if LEGACY_AVAILABILITY_CHECK:
+        return [
+            ("order.check_availability", check_availability(item_name, quantity)),
+            ("order.reduce_inventory", reduce_inventory(item_name, quantity, idempotency_key)),
+        ]
+    return [("order.reserve_inventory", reserve_inventory(item_name, quantity, idempotency_key))]
+
+
+def call(service_call: ServiceCall, budget: Budget):
+    try:
+        response = session.request(
+            service_call.method, service_call.url,
+            params=service_call.params, json=service_call.json, headers=service_call.headers,
+            timeout=budget.timeout(service_call.timeout),
+        )
+        return service_call.read(response)
     except requests.RequestException as e:
-        logger.error(f"Failed to check inventory: {e}")
-        return {"error": "Inventory check failed"}
-    
+        logger.error(f"Failed to {service_call.action}: {e}")
+        return service_call.error
+
+
+def new_orders(items: list, status: str = "confirmed") -> list:
+    return [Order(item_name=item.item_name, quantity=item.quantity, status=status) for item in items]
+
+
+def order_rows(orders: list) -> list:
+    # Read after flush so that the expired instances are not reloaded one by one after commit
+    return [
+        {"id": order.id, "item_name": order.item_name, "quantity": order.quantity, "status": order.status}
+        for order in orders
+    ]
+
+
+def store_order(db: Session, item_name: str, quantity: int):
     logger.info(f"Creating order: item_name={item_name}, quantity: {quantity}")
     order = Order(item_name=item_name, quantity=quantity)
     db.add(order)
     db.commit()
     db.refresh(order)
     logger.info(f"Order created: {order.id}")
-    
-    # Reduce inventory quantity
+    return order
+
+
+def store_orders(db: Session, items: list):
+    # Insert all order rows in one transaction
+    orders = new_orders(items)
+    db.add_all(orders)
+    db.flush()
+    created = order_rows(orders)
+    db.commit()
+    logger.info(f"Orders created: {[order['id'] for order in created]}")
+    return created
+
+
+def create_order_via_outbox(db: Session, item_name: str, quantity: int):
+    logger.info(f"Creating order with outbox events: item_name={item_name}, quantity: {quantity}")
+    order = Order(item_name=item_name, quantity=quantity, status="pending")
+    db.add(order)
+    db.flush()
+    db.add_all(order_events(order))
+    db.commit()
+    db.refresh(order)
+    logger.info(f"Order created: {order.id}")
+    return order
+
+
+def create_orders_via_outbox(db: Session, items: list):
+    orders = new_orders(items, "pending")
+    db.add_all(orders)
+    db.flush()
+    db.add_all(batch_events(orders))
+    created = order_rows(orders)
+    db.commit()
+    logger.info(f"Orders created with outbox events: {[order['id'] for order in created]}")
+    return created
+
+
+def create_order(db: Session, item_name: str, quantity: int, idempotency_key: str | None = None):
+    if ORDER_OUTBOX_ENABLED:
+        return create_order_via_outbox(db, item_name, quantity)
+    budget = Budget()
     try:
-        reduce_response = requests.post(
-            f"{INVENTORY_SERVICE_URL}/products/{item_name}/reduce-quantity", 
-            json={"quantity": quantity}
-        )
-        reduce_response.raise_for_status()
-        logger.info(f"Inventory updated successfully for item: {item_name}, quantity reduced by {quantity}")
-    except requests.RequestException as e:
-        logger.error(f"Failed to reduce inventory: {e}")
-        return {"error": "Inventory reduction failed"}
-    
-    # Generate invoice data
-    invoice_data = {
-        "CustomerName": f"Customer-{random.randint(1000, 9999)}",
-        "Amount": round(random.uniform(10.0, 500.0), 2),
-        "DueDate": (datetime.utcnow() + timedelta(days=random.randint(7, 30))).isoformat()
-    }
-    
-    # Send invoice creation request
+        for name, stage in inventory_stages(item_name, quantity, idempotency_key):
+            logger.info(f"Inventory stage {name} for item: {item_name}, quantity: {quantity}")
+            error = run_stage(name, call, stage, budget)
+            if error is not None:
+                return error
+    except DeadlineExceeded:
+        logger.error(f"Order for item {item_name} exceeded its {ORDER_REQUEST_BUDGET}s budget")
+        return DEADLINE_ERROR
+
+    # The stock is held: store the order whatever is left of the budget
+    results = fan_out(budget, {
+        "order.store": lambda: store_order(db, item_name, quantity),
+        "order.send_invoice": partial(call, send_invoice(build_invoice_data()), budget),
+    }, late=INVOICE_LATE)
+    return with_warnings(results["order.store"], results)
+
+def create_orders(db: Session, items: list, idempotency_key: str | None = None):
+    if ORDER_OUTBOX_ENABLED:
+        return create_orders_via_outbox(db, items)
+    budget = Budget()
+    logger.info(f"Reserving inventory for {len(items)} items")
+    try:
+        error = run_stage("order.reserve_items", call, reserve_items(items, idempotency_key), budget)
+        if error is not None:
+            return error
+    except DeadlineExceeded:
+        logger.error(f"Batch order of {len(items)} items exceeded its {ORDER_REQUEST_BUDGET}s budget")
+        return DEADLINE_ERROR
+
+    # A single invoice for the whole basket, sent while the rows are inserted
+    results = fan_out(budget, {
+        "order.store": lambda: store_orders(db, items),
+        "order.send_invoice": partial(call, send_invoice(build_invoice_data()), budget),
+    }, late=INVOICE_LATE)
+    return with_warnings(results["order.store"], results)
+
+# Returns the page and the cursor of the next one (None on the last page)
+def get_orders(db: Session, limit: int = 100, cursor: int | None = None, **filters) -> tuple[list, int | None]:
+    logger.info(f"Fetching orders with limit={limit}, cursor={cursor} and filters={filters}")
+    orders = [order_row(row) for row in db.execute(orders_query(limit, cursor, **filters))]
+    logger.info(f"Fetched {len(orders)} orders")
+    return orders, next_cursor(orders, limit)
+
+# Stream orders as NDJSON lines from a server-side cursor (limit 0 = all matching orders).
+# The response outlives the request's session dependency, so the generator opens its own.
+def stream_orders(limit: int = 0, cursor: int | None = None, **filters):
+    logger.info(f"Streaming orders with limit={limit}, cursor={cursor} and filters={filters}")
+    stmt = orders_query(limit, cursor, **filters).execution_options(yield_per=ORDERS_STREAM_BATCH_SIZE)
+    with SessionLocal() as db:
+        for row in db.execute(stmt):
+            yield json.dumps(order_row(row)) + "\n"
+
+
+# ==========================
+# Async variants (ORDER_ASYNC_MODE)
+# ==========================
+# The same flows on AsyncSession and the httpx client, so one worker can overlap
+# the inventory, database and invoice waits of many concurrent orders.
+
+async def call_async(service_call: ServiceCall, budget: Budget):
     try:
-        invoice_response = requests.post(
-            f"{INVOICE_SERVICE_URL}/invoices", 
-            json=invoice_data
+        response = await async_session.request(
+            service_call.method, service_call.url,
+            params=service_call.params, json=service_call.json, headers=service_call.headers,
+            timeout=budget.timeout(service_call.timeout),
         )
-        invoice_response.raise_for_status()
-        logger.info(f"Invoice created successfully: {invoice_data}")
-    except requests.RequestException as e:
-        logger.error(f"Failed to create invoice: {e}")
-        return {"error": "Invoice creation failed"}
-    
+        return service_call.read(response)
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to {service_call.action}: {e}")
+        return service_call.error
+
+
+async def store_order_async(db: AsyncSession, item_name: str, quantity: int):
+    logger.info(f"Creating order: item_name={item_name}, quantity: {quantity}")
+    order = Order(item_name=item_name, quantity=quantity)
+    db.add(order)
+    await db.commit()
+    logger.info(f"Order created: {order.id}")
     return order
 
-def get_orders(db: Session):
-    logger.info("Fetching all orders")
-    orders = db.query(Order).all()
+
+async def store_orders_async(db: AsyncSession, items: list):
+    orders = new_orders(items)
+    db.add_all(orders)
+    await db.flush()
+    created = order_rows(orders)
+    await db.commit()
+    logger.info(f"Orders created: {[order['id'] for order in created]}")
+    return created
+
+
+async def create_order_via_outbox_async(db: AsyncSession, item_name: str, quantity: int):
+    logger.info(f"Creating order with outbox events: item_name={item_name}, quantity: {quantity}")
+    order = Order(item_name=item_name, quantity=quantity, status="pending")
+    db.add(order)
+    await db.flush()
+    db.add_all(order_events(order))
+    await db.commit()
+    logger.info(f"Order created: {order.id}")
+    return order
+
+
+async def create_orders_via_outbox_async(db: AsyncSession, items: list):
+    orders = new_orders(items, "pending")
+    db.add_all(orders)
+    await db.flush()
+    db.add_all(batch_events(orders))
+    created = order_rows(orders)
+    await db.commit()
+    logger.info(f"Orders created with outbox events: {[order['id'] for order in created]}")
+    return created
+
+
+async def create_order_async(db: AsyncSession, item_name: str, quantity: int, idempotency_key: str | None = None):
+    if ORDER_OUTBOX_ENABLED:
+        return await create_order_via_outbox_async(db, item_name, quantity)
+    budget = Budget()
+    try:
+        for name, stage in inventory_stages(item_name, quantity, idempotency_key):
+            logger.info(f"Inventory stage {name} for item: {item_name}, quantity: {quantity}")
+            error = await run_stage_async(name, call_async(stage, budget))
+            if error is not None:
+                return error
+    except DeadlineExceeded:
+        logger.error(f"Order for item {item_name} exceeded its {ORDER_REQUEST_BUDGET}s budget")
+        return DEADLINE_ERROR
+
+    results = await fan_out_async(budget, {
+        "order.store": store_order_async(db, item_name, quantity),
+        "order.send_invoice": call_async(send_invoice(build_invoice_data()), budget),
+    }, late=INVOICE_LATE)
+    return with_warnings(results["order.store"], results)
+
+
+async def create_orders_async(db: AsyncSession, items: list, idempotency_key: str | None = None):
+    if ORDER_OUTBOX_ENABLED:
+        return await create_orders_via_outbox_async(db, items)
+    budget = Budget()
+    logger.info(f"Reserving inventory for {len(items)} items")
+    try:
+        error = await run_stage_async("order.reserve_items", call_async(reserve_items(items, idempotency_key), budget))
+        if error is not None:
+            return error
+    except DeadlineExceeded:
+        logger.error(f"Batch order of {len(items)} items exceeded its {ORDER_REQUEST_BUDGET}s budget")
+        return DEADLINE_ERROR
+
+    results = await fan_out_async(budget, {
+        "order.store": store_orders_async(db, items),
+        "order.send_invoice": call_async(send_invoice(build_invoice_data()), budget),
+    }, late=INVOICE_LATE)
+    return with_warnings(results["order.store"], results)
+
+
+async def get_orders_async(db: AsyncSession, limit: int = 100, cursor: int | None = None, **filters) -> tuple[list, int | None]:
+    logger.info(f"Fetching orders with limit={limit}, cursor={cursor} and filters={filters}")
+    orders = [order_row(row) for row in await db.execute(orders_query(limit, cursor, **filters))]
     logger.info(f"Fetched {len(orders)} orders")
-    return orders
+    return orders, next_cursor(orders, limit)
+
+
+async def stream_orders_async(limit: int = 0, cursor: int | None = None, **filters):
+    logger.info(f"Streaming orders with limit={limit}, cursor={cursor} and filters={filters}")
+    stmt = orders_query(limit, cursor, **filters).execution_options(yield_per=ORDERS_STREAM_BATCH_SIZE)
+    async with AsyncSessionLocal() as db:
+        async for row in await db.stream(stmt):
+            yield json.dumps(order_row(row)) + "\n"
@@ -1,12 +1,63 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, inspect, MetaData, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Serve the order endpoints as coroutines on an AsyncEngine instead of the threadpool
+ORDER_ASYNC_MODE = os.getenv("ORDER_ASYNC_MODE", "false").lower() == "true"
+# Async driver URL; derived from DATABASE_URL (postgresql:// -> postgresql+asyncpg://) when unset
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (
+    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1) if DATABASE_URL else None
+)
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 metadata = MetaData()
+
+# The sync engine is still used for schema setup; the async one only exists in async mode
+async_engine = create_async_engine(ASYNC_DATABASE_URL) if ORDER_ASYNC_MODE else None
+# expire_on_commit=False: returned orders must not lazy-load (which is not possible) after commit
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if ORDER_ASYNC_MODE else None
+)
+
+
+def ensure_columns(model_metadata: MetaData):
+    """Add columns declared on the models that are missing from already existing tables."""
+    # create_all never alters existing tables; added columns must be nullable or
+    # have a server default (existing rows get the default)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in model_metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_spec = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_spec}"))
+
+
+def ensure_indexes(model_metadata: MetaData):
+    """Create indexes declared on the models that are missing from already existing tables."""
+    # create_all only creates indexes together with new tables
+    for table in model_metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def warm_up():
+    """Open the first pooled connection before serving traffic."""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def warm_up_async():
+    """Open the first connection of the async pool before serving traffic."""
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
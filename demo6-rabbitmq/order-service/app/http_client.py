@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+# Pool sizing, timeouts and retry budget for outgoing service calls
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # Number of per-host pools kept
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))  # Keep-alive connections per host
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"  # Wait for a free connection instead of opening extra ones
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.1"))
+
+meter = metrics.get_meter(__name__)
+
+
+class InFlightRequests:
+    """Per-host count of outgoing requests in flight, shared by the sync and async clients."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def track(self, url):
+        host = urlsplit(str(url)).netloc
+        with self._lock:
+            self._counts[host] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._counts[host] -= 1
+
+    def observe_in_flight(self, options: CallbackOptions):
+        with self._lock:
+            snapshot = dict(self._counts)
+        for host, count in snapshot.items():
+            yield Observation(count, {"server.address": host})
+
+    def observe_saturation(self, options: CallbackOptions):
+        with self._lock:
+            snapshot = dict(self._counts)
+        for host, count in snapshot.items():
+            yield Observation(count / HTTP_POOL_MAXSIZE, {"server.address": host})
+
+
+in_flight = InFlightRequests()
+
+
+class PooledSession(requests.Session):
+    """
+    requests Session with bounded keep-alive pools per host, default timeouts
+    and a retry budget.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Connection errors are retried for every method (nothing was sent yet);
+        # read errors and 5xx responses only for idempotent methods
+        retry = Retry(
+            total=HTTP_MAX_RETRIES,
+            backoff_factor=HTTP_RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            pool_block=HTTP_POOL_BLOCK,
+            max_retries=retry,
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        with in_flight.track(url):
+            return super().request(method, url, **kwargs)
+
+
+class PooledAsyncClient(httpx.AsyncClient):
+    """
+    httpx AsyncClient with the same pool size, timeouts and in-flight tracking
+    as PooledSession, for the async order-service. The transport only retries
+    connection errors; httpx never re-sends a request that reached the server.
+    """
+
+    def __init__(self):
+        super().__init__(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+            # pool=None waits for a free connection as long as needed (HTTP_POOL_BLOCK)
+            timeout=httpx.Timeout(
+                HTTP_READ_TIMEOUT,
+                connect=HTTP_CONNECT_TIMEOUT,
+                pool=None if HTTP_POOL_BLOCK else HTTP_CONNECT_TIMEOUT,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_MAX_RETRIES),
+        )
+
+    async def send(self, request, **kwargs):
+        with in_flight.track(request.url):
+            return await super().send(request, **kwargs)
+
+
+# Shared clients reused by every request handler
+session = PooledSession()
+async_session = PooledAsyncClient()
+
+meter.create_observable_gauge(
+    "http_client_pool_in_use",
+    callbacks=[in_flight.observe_in_flight],
+    description="In-flight outgoing requests per host",
+)
+meter.create_observable_gauge(
+    "http_client_pool_saturation",
+    callbacks=[in_flight.observe_saturation],
+    description="In-flight outgoing requests per host divided by the pool size",
+)
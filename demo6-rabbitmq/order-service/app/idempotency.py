@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from opentelemetry import metrics
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+# Recorded responses are replayed for IDEMPOTENCY_TTL seconds; the in-process store keeps
+# at most IDEMPOTENCY_CACHE_SIZE keys. "sql" also records them in the idempotency_keys
+# table so that replays are recognised by every replica and survive restarts.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_BACKING = os.getenv("IDEMPOTENCY_BACKING", "memory")  # memory | sql
+# A pending claim whose request has not finished after IDEMPOTENCY_LEASE seconds (e.g. the
+# replica crashed) is taken over by the next request with the same key
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "60"))
+IDEMPOTENCY_PURGE_INTERVAL = 300  # seconds between deletes of expired rows
+
+meter = metrics.get_meter(__name__)
+
+replay_counter = meter.create_counter(
+    "idempotent_replays",
+    description="Requests answered with the response recorded for their Idempotency-Key",
+)
+
+
+class IdempotencyStore:
+    """
+    Bounded LRU of idempotency records with a TTL, optionally backed by the
+    idempotency_keys table. A record is {"fingerprint", "state": "pending" | "done",
+    "status_code", "body"}; "pending" means the first request is still running.
+    Pending claims expire after `lease` seconds. Thread-safe, as the sync
+    endpoints run in the threadpool.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, lease: float, backed: bool = False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lease = lease
+        self.backed = backed
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._next_purge = 0.0
+
+    def claim(self, key: str, fingerprint: str) -> dict | None:
+        """Reserve `key` for a new request; returns the existing record if there is one."""
+        record = {"fingerprint": fingerprint, "state": "pending"}
+        with self._lock:
+            existing = self._get(key)
+            if existing is not None:
+                return existing
+            self._put(key, record, self.lease)
+        if self.backed:
+            existing = self._claim_row(key, fingerprint)
+            if existing is not None:
+                with self._lock:
+                    self._entries.pop(key, None)
+                return existing
+        return None
+
+    def complete(self, key: str, status_code: int, body) -> None:
+        with self._lock:
+            self._put(key, {**(self._get(key) or {}), "state": "done", "status_code": status_code, "body": body}, self.ttl)
+        if self.backed:
+            with SessionLocal() as db:
+                row = db.get(IdempotencyRecord, key)
+                if row is not None:
+                    row.state, row.status_code, row.body = "done", status_code, body
+                    db.commit()
+
+    def release(self, key: str) -> None:
+        """Forget a claim whose request failed, so that a retry runs it again."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backed:
+            with SessionLocal() as db:
+                db.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.key == key, IdempotencyRecord.state == "pending"
+                ))
+                db.commit()
+
+    def _claim_row(self, key: str, fingerprint: str) -> dict | None:
+        # The primary key makes the claim atomic across replicas
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.ttl)
+        expired = or_(
+            IdempotencyRecord.created_at < cutoff,
+            and_(IdempotencyRecord.state == "pending", IdempotencyRecord.created_at < now - timedelta(seconds=self.lease)),
+        )
+        with SessionLocal() as db:
+            if time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + IDEMPOTENCY_PURGE_INTERVAL
+                db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff))
+            # Drop the key's record if it is stale or an abandoned claim, so it can be claimed again
+            db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key == key, expired))
+            db.add(IdempotencyRecord(key=key, fingerprint=fingerprint, state="pending", created_at=now))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+            row = db.get(IdempotencyRecord, key)
+            if row is None:
+                return None
+            return {"fingerprint": row.fingerprint, "state": row.state, "status_code": row.status_code, "body": row.body}
+
+    def _get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return record
+
+    def _put(self, key: str, record: dict, ttl: float) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, record)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+store = IdempotencyStore(
+    IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL, IDEMPOTENCY_LEASE, backed=IDEMPOTENCY_BACKING == "sql"
+)
+
+
+def fingerprint_of(request: dict) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(request), sort_keys=True).encode()).hexdigest()
+
+
+def is_error(result) -> bool:
+    # crud reports failed stages as {"error": ...} instead of raising, and only
+    # before anything is committed: once the order is stored its response (with
+    # "warnings" for failed follow-up calls) must be recorded, not retried
+    return isinstance(result, dict) and "error" in result
+
+
+def replay(scoped_key: str, scope: str, record: dict, fingerprint: str):
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+    if record["state"] == "pending":
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+    replay_counter.add(1, {"scope": scope})
+    logger.info(f"Replaying recorded response for {scoped_key}")
+    return JSONResponse(record["body"], status_code=record["status_code"], headers={"Idempotent-Replayed": "true"})
+
+
+def idempotent(key: str | None, scope: str, request: dict, handler):
+    """
+    Run `handler` once per Idempotency-Key. Replays get the recorded response;
+    failures (exceptions and error results) are not recorded so that they can be
+    retried, so handlers must only return an error result if nothing was committed.
+    """
+    if key is None:
+        return handler()
+    scoped_key = f"{scope}:{key}"
+    fingerprint = fingerprint_of(request)
+    record = store.claim(scoped_key, fingerprint)
+    if record is not None:
+        return replay(scoped_key, scope, record, fingerprint)
+    try:
+        result = handler()
+    except BaseException:
+        store.release(scoped_key)
+        raise
+    if is_error(result):
+        store.release(scoped_key)
+        return result
+    store.complete(scoped_key, 200, jsonable_encoder(result))
+    return result
+
+
+async def idempotent_async(key: str | None, scope: str, request: dict, handler):
+    """idempotent() for coroutine handlers; the SQL backing is used off the event loop."""
+    if key is None:
+        return await handler()
+
+    async def call(fn, *args):
+        return await asyncio.to_thread(fn, *args) if store.backed else fn(*args)
+
+    scoped_key = f"{scope}:{key}"
+    fingerprint = fingerprint_of(request)
+    record = await call(store.claim, scoped_key, fingerprint)
+    if record is not None:
+        return replay(scoped_key, scope, record, fingerprint)
+    try:
+        result = await handler()
+    except BaseException:
+        await call(store.release, scoped_key)
+        raise
+    if is_error(result):
+        await call(store.release, scoped_key)
+        return result
+    await call(store.complete, scoped_key, 200, jsonable_encoder(result))
+    return result
@@ -1,18 +1,57 @@
-from fastapi import FastAPI, Depends
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine
-from .models import Base
-from .crud import create_order, get_orders
+from .database import (
+    ORDER_ASYNC_MODE, AsyncSessionLocal, SessionLocal, async_engine, engine,
+    ensure_columns, ensure_indexes, warm_up, warm_up_async
+)
+from .models import Base, OrderBatchRequest
+from .crud import (
+    ORDER_OUTBOX_ENABLED, create_order, create_order_async, create_orders, create_orders_async,
+    get_orders, get_orders_async, stream_orders, stream_orders_async
+)
+from .http_client import async_session, session
+from .idempotency import idempotent, idempotent_async
+from .outbox import dispatcher
+from otel_flush import flush_telemetry  # Shared telemetry flush (demo root)
 import logging
 import os
 import time
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 # Initialize DB
-Base.metadata.create_all(bind=engine)
+def init_db():
+    Base.metadata.create_all(bind=engine)
+    ensure_columns(Base.metadata)
+    ensure_indexes(Base.metadata)
+    warm_up()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema, indexes and pool warm-up run off the event loop before taking traffic
+    await asyncio.to_thread(init_db)
+    if ORDER_ASYNC_MODE:
+        await warm_up_async()
+    if ORDER_OUTBOX_ENABLED:
+        dispatcher.start()
+    logger.info(f"Order service ready ({'async' if ORDER_ASYNC_MODE else 'sync'} mode)")
+    yield
+    # Runs on SIGTERM: finish the current outbox round, release connections and flush telemetry
+    if ORDER_OUTBOX_ENABLED:
+        await asyncio.to_thread(dispatcher.stop)
+    session.close()
+    await async_session.aclose()
+    engine.dispose()
+    if ORDER_ASYNC_MODE:
+        await async_engine.dispose()
+    await asyncio.to_thread(flush_telemetry)
+
+app = FastAPI(lifespan=lifespan)
 
 # Dependency for DB session
 def get_db():
@@ -22,10 +61,107 @@ def get_db():
     finally:
         db.close()
 
-@app.post("/orders/")
-def place_order(item_name: str, quantity: int, db: Session = Depends(get_db)):
-    return create_order(db, item_name, quantity)
+# Listing filters shared by the sync and async endpoints
+def order_filters(
+    item_name: str | None = None,
+    created_from: datetime | None = Query(None, description="Only orders created at or after this time"),
+    created_to: datetime | None = Query(None, description="Only orders created before this time"),
+):
+    return {"item_name": item_name, "created_from": created_from, "created_to": created_to}
+
+def page_response(orders: list, next_cursor: int | None):
+    # Rows are already plain dicts, so skip response model validation
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+    return JSONResponse(orders, headers=headers)
+
+# Pages are capped at ORDERS_PAGE_MAX_LIMIT; only the NDJSON stream may be unbounded (limit=0)
+ORDERS_PAGE_MAX_LIMIT = int(os.getenv("ORDERS_PAGE_MAX_LIMIT", "1000"))
+
+def checked_limit(limit: int, stream: bool) -> int:
+    if not stream and not 1 <= limit <= ORDERS_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {ORDERS_PAGE_MAX_LIMIT}")
+    return limit
+
+LIMIT_QUERY = Query(100, ge=0, description="Page size; with stream=true, 0 streams every matching order")
+CURSOR_QUERY = Query(None, description="Last order id of the previous page, from its X-Next-Cursor header")
+STREAM_QUERY = Query(False, description="Stream orders as NDJSON instead of returning a page")
+IDEMPOTENCY_HEADER = Header(None, description="Retries with the same key replay the first response")
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+if ORDER_ASYNC_MODE:
+    # Coroutine endpoints: many orders overlap their I/O on the event loop
+    @app.post("/orders/")
+    async def place_order(
+        item_name: str,
+        quantity: int,
+        idempotency_key: str | None = IDEMPOTENCY_HEADER,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await idempotent_async(
+            idempotency_key, "orders", {"item_name": item_name, "quantity": quantity},
+            lambda: create_order_async(db, item_name, quantity, idempotency_key),
+        )
+
+    @app.post("/orders/batch")
+    async def place_orders(
+        order_request: OrderBatchRequest,
+        idempotency_key: str | None = IDEMPOTENCY_HEADER,
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        return await idempotent_async(
+            idempotency_key, "orders-batch", order_request.dict(),
+            lambda: create_orders_async(db, order_request.items, idempotency_key),
+        )
+
+    @app.get("/orders/")
+    async def list_orders(
+        limit: int = LIMIT_QUERY,
+        cursor: int | None = CURSOR_QUERY,
+        stream: bool = STREAM_QUERY,
+        filters: dict = Depends(order_filters),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        limit = checked_limit(limit, stream)
+        if stream:
+            return StreamingResponse(stream_orders_async(limit, cursor, **filters), media_type="application/x-ndjson")
+        return page_response(*await get_orders_async(db, limit, cursor, **filters))
+else:
+    # Blocking endpoints, run in FastAPI's threadpool
+    @app.post("/orders/")
+    def place_order(
+        item_name: str,
+        quantity: int,
+        idempotency_key: str | None = IDEMPOTENCY_HEADER,
+        db: Session = Depends(get_db),
+    ):
+        return idempotent(
+            idempotency_key, "orders", {"item_name": item_name, "quantity": quantity},
+            lambda: create_order(db, item_name, quantity, idempotency_key),
+        )
+
+    @app.post("/orders/batch")
+    def place_orders(
+        order_request: OrderBatchRequest,
+        idempotency_key: str | None = IDEMPOTENCY_HEADER,
+        db: Session = Depends(get_db),
+    ):
+        return idempotent(
+            idempotency_key, "orders-batch", order_request.dict(),
+            lambda: create_orders(db, order_request.items, idempotency_key),
+        )
 
-@app.get("/orders/")
-def list_orders(db: Session = Depends(get_db)):
-    return get_orders(db)
+    @app.get("/orders/")
+    def list_orders(
+        limit: int = LIMIT_QUERY,
+        cursor: int | None = CURSOR_QUERY,
+        stream: bool = STREAM_QUERY,
+        filters: dict = Depends(order_filters),
+        db: Session = Depends(get_db),
+    ):
+        limit = checked_limit(limit, stream)
+        if stream:
+            return StreamingResponse(stream_orders(limit, cursor, **filters), media_type="application/x-ndjson")
+        return page_response(*get_orders(db, limit, cursor, **filters))
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import JSON, Column, DateTime, Index, Integer, String, func, text
 from sqlalchemy.ext.declarative import declarative_base
+from pydantic import BaseModel
 
 Base = declarative_base()
 
@@ -9,3 +10,52 @@ class Order(Base):
     id = Column(Integer, primary_key=True, index=True)
     item_name = Column(String, index=True)
     quantity = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # Outbox orders stay pending until the dispatcher has delivered their stock event
+    status = Column(String, nullable=False, server_default="confirmed")  # pending | confirmed | rejected
+
+    # Fetch created_at in the INSERT itself so returned orders never lazy-load it
+    __mapper_args__ = {"eager_defaults": True}
+
+
+# Downstream calls owed for an order, written in the order's own transaction and
+# delivered by the outbox dispatcher (ORDER_OUTBOX_ENABLED)
+class OutboxEvent(Base):
+    __tablename__ = "order_outbox"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, index=True)
+    event_type = Column(String, nullable=False)  # reduce_inventory | reserve_items | send_invoice
+    payload = Column(JSON, nullable=False)
+    trace_context = Column(JSON)  # W3C headers of the request that created the event
+    status = Column(String, nullable=False, server_default="pending")  # pending | delivered | failed
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # The dispatcher only ever scans pending events that are due
+    __table_args__ = (
+        Index("ix_order_outbox_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
+
+
+# Responses recorded per Idempotency-Key (IDEMPOTENCY_BACKING=sql)
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    state = Column(String, nullable=False)  # pending | done
+    status_code = Column(Integer)
+    body = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+# Request body for a multi-line order (one Order row per line)
+class OrderLine(BaseModel):
+    item_name: str
+    quantity: int
+
+class OrderBatchRequest(BaseModel):
+    items: list[OrderLine]
@@ -0,0 +1,190 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+import requests
+from sqlalchemy import select, update
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from .crud import INVENTORY_SERVICE_URL, INVOICE_SERVICE_URL
+from .database import SessionLocal
+from .http_client import session
+from .models import Order, OutboxEvent
+from .pipeline import INVENTORY_CALL_TIMEOUT, INVOICE_CALL_TIMEOUT, executor
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+# Events claimed per round; a full batch is followed immediately by the next one
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))  # seconds between polls of an idle outbox
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# Exponential retry delay: OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1), capped
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "1"))  # seconds
+OUTBOX_RETRY_MAX_BACKOFF = float(os.getenv("OUTBOX_RETRY_MAX_BACKOFF", "60"))  # seconds
+# Claimed events are not due again for OUTBOX_CLAIM_TIMEOUT seconds; events of a round
+# that never finished (e.g. the replica died) are then sent again with the same Idempotency-Key
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "60"))
+# Wait at shutdown for the current round
+OUTBOX_STOP_TIMEOUT = float(os.getenv("OUTBOX_STOP_TIMEOUT", "10"))  # seconds
+
+
+# Events that carry the invoice of their order, queued once they are delivered
+STOCK_EVENTS = ("reduce_inventory", "reserve_items")
+
+
+class PermanentFailure(Exception):
+    """The downstream service rejected the event; retrying cannot succeed."""
+
+
+def deliver(event_id: int, event_type: str, payload: dict):
+    """
+    Send one event. The Idempotency-Key lets the receiver drop redeliveries of the
+    same event: the inventory replays its recorded response and the invoice service
+    derives the invoice id from it.
+    """
+    headers = {"Idempotency-Key": f"order-outbox-{event_id}"}
+    if event_type == "reduce_inventory":
+        response = session.post(
+            f"{INVENTORY_SERVICE_URL}/products/{payload['item_name']}/reduce-quantity",
+            json={"quantity": payload["quantity"]},
+            headers=headers,
+            timeout=INVENTORY_CALL_TIMEOUT,
+        )
+    elif event_type == "reserve_items":
+        response = session.post(
+            f"{INVENTORY_SERVICE_URL}/products/reserve",
+            json={"items": payload["items"]},
+            headers=headers,
+            timeout=INVENTORY_CALL_TIMEOUT,
+        )
+    elif event_type == "send_invoice":
+        response = session.post(
+            f"{INVOICE_SERVICE_URL}/invoices", json=payload, headers=headers, timeout=INVOICE_CALL_TIMEOUT
+        )
+    else:
+        raise PermanentFailure(f"Unknown event type {event_type}")
+    # 404 (unknown product) and 400 (not enough stock) will not change on retry
+    if event_type != "send_invoice" and response.status_code in (400, 404):
+        raise PermanentFailure(f"{response.status_code} {response.text}")
+    response.raise_for_status()
+
+
+def dispatch(event_id: int, event_type: str, payload: dict, trace_context: dict | None):
+    """Deliver an event in a span parented by the order request; returns (error, permanent)."""
+    ctx = extract(trace_context or {})
+    with tracer.start_as_current_span(f"outbox.{event_type}", context=ctx, kind=trace.SpanKind.PRODUCER) as span:
+        span.set_attribute("outbox.event_id", event_id)
+        try:
+            deliver(event_id, event_type, payload)
+        except PermanentFailure as e:
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            return str(e), True
+        except requests.RequestException as e:
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            return str(e), False
+        except Exception as e:
+            # e.g. a malformed payload: counts as a failed attempt instead of aborting the round
+            span.record_exception(e)
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            return f"{type(e).__name__}: {e}", False
+    return None, False
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_BACKOFF))
+
+
+def set_order_status(db, event: OutboxEvent, status: str):
+    """Confirm or reject the orders of a settled stock event (all the orders of a basket)."""
+    ids = event.payload.get("order_ids") or [event.order_id]
+    db.execute(update(Order).where(Order.id.in_(ids)).values(status=status))
+
+
+class OutboxDispatcher:
+    """
+    Background thread that drains order_outbox. Each round claims a batch of due
+    events with FOR UPDATE SKIP LOCKED (so several replicas can dispatch side by
+    side) and commits the claim, delivers them concurrently without holding any
+    lock, then records the outcomes in a second transaction.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="order-outbox", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("Outbox dispatcher started")
+
+    def stop(self, timeout: float = OUTBOX_STOP_TIMEOUT):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                dispatched = self.dispatch_batch()
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+                dispatched = 0
+            if dispatched < OUTBOX_BATCH_SIZE:
+                self._stop.wait(OUTBOX_POLL_INTERVAL)
+
+    def claim(self) -> list:
+        """Lease a batch of due events to this replica; returns plain values for the worker threads."""
+        with SessionLocal() as db:
+            now = datetime.now(timezone.utc)
+            events = db.scalars(
+                select(OutboxEvent)
+                .where(OutboxEvent.status == "pending", OutboxEvent.next_attempt_at <= now)
+                .order_by(OutboxEvent.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            ).all()
+            work = [(event.id, event.event_type, event.payload, event.trace_context) for event in events]
+            for event in events:
+                event.next_attempt_at = now + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+            db.commit()
+            return work
+
+    def dispatch_batch(self) -> int:
+        work = self.claim()
+        if not work:
+            return 0
+        outcomes = list(executor.map(lambda args: dispatch(*args), work))
+
+        with SessionLocal() as db:
+            now = datetime.now(timezone.utc)
+            for (event_id, *_), (error, permanent) in zip(work, outcomes):
+                event = db.get(OutboxEvent, event_id)
+                if event is None or event.status != "pending":
+                    continue  # settled by another replica after our claim expired
+                event.attempts += 1
+                if error is None:
+                    event.status = "delivered"
+                    event.last_error = None
+                    if event.event_type in STOCK_EVENTS:
+                        set_order_status(db, event, "confirmed")
+                        if event.payload.get("invoice") is not None:
+                            # Invoice only orders whose stock change went through
+                            db.add(OutboxEvent(
+                                order_id=event.order_id,
+                                event_type="send_invoice",
+                                payload=event.payload["invoice"],
+                                trace_context=event.trace_context,
+                            ))
+                elif permanent or event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    event.status = "failed"
+                    event.last_error = error
+                    logger.error(f"Outbox event {event.id} ({event.event_type}) for order {event.order_id} failed: {error}")
+                    if event.event_type in STOCK_EVENTS:
+                        set_order_status(db, event, "rejected")
+                else:
+                    event.next_attempt_at = now + retry_delay(event.attempts)
+                    event.last_error = error
+                    logger.warning(f"Outbox event {event.id} ({event.event_type}) will be retried: {error}")
+            db.commit()
+        return len(work)
+
+dispatcher = OutboxDispatcher()
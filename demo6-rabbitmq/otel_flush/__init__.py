@@ -0,0 +1,37 @@
+"""
+Telemetry flush shared by the demo6 Python services (copied into each image, see
+the Dockerfiles). The providers are set up by opentelemetry-instrument; the
+services only flush them on shutdown.
+"""
+import os
+import time
+import logging
+import threading
+from opentelemetry import metrics, trace
+from opentelemetry._logs import get_logger_provider
+
+logger = logging.getLogger(__name__)
+
+# Overall deadline for flushing spans, logs and metrics when the service stops
+SHUTDOWN_TIMEOUT = int(os.getenv("OTEL_SHUTDOWN_TIMEOUT", "5000"))  # milliseconds
+
+
+def flush_telemetry(timeout_millis: int = SHUTDOWN_TIMEOUT) -> None:
+    """Force-flush traces, logs and metrics, giving up after `timeout_millis`."""
+    deadline = time.monotonic() + timeout_millis / 1000
+
+    def flush():
+        for provider in (trace.get_tracer_provider(), get_logger_provider(), metrics.get_meter_provider()):
+            force_flush = getattr(provider, "force_flush", None)
+            if force_flush is None:
+                continue
+            try:
+                force_flush(max(0, int((deadline - time.monotonic()) * 1000)))
+            except Exception as e:
+                logger.warning(f"Failed to flush {type(provider).__name__}: {e}")
+
+    worker = threading.Thread(target=flush, name="otel-flush", daemon=True)
+    worker.start()
+    worker.join(timeout_millis / 1000)
+    if worker.is_alive():
+        logger.warning(f"Telemetry flush did not finish within {timeout_millis} ms")